@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Mode des agrégations : 'parallel' (partitions réparties sur un pool de threads) ou 'serial'
+AGGREGATION_MODES = ('serial', 'parallel')
+AGGREGATION_WORKERS = int(os.environ.get('VENTES_AGGREGATION_WORKERS', str(os.cpu_count() or 1)))
+# En dessous de ce nombre de lignes, le découpage coûte plus qu'il ne rapporte
+PARALLEL_MIN_ROWS = 500_000
+# Clé de partitionnement : des pays différents ne partagent aucun groupe, les résultats partiels sont disjoints
+PARTITION_KEY = 'CountryKey'
+# Clés à faible cardinalité : les résultats partiels par plages de lignes sont petits et se fusionnent sans coût
+LOW_CARDINALITY_KEYS = {'CountryKey', 'MonthKey'}
+
+_settings = {'mode': os.environ.get('VENTES_AGGREGATION', 'parallel')}
+_local = threading.local()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Fonctions pour choisir le mode d'exécution (pour tout le processus, ou le temps d'un bloc dans le thread courant)
+def set_mode(mode):
+    if mode not in AGGREGATION_MODES:
+        raise ValueError(f"Mode d'agrégation inconnu : {mode}")
+    _settings['mode'] = mode
+
+
+def get_mode():
+    return getattr(_local, 'mode', None) or _settings['mode']
+
+
+@contextmanager
+def execution_mode(mode):
+    previous = getattr(_local, 'mode', None)
+    _local.mode = mode
+    try:
+        yield
+    finally:
+        _local.mode = previous
+
+
+# Pool de threads partagé, créé à la première agrégation parallèle
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=AGGREGATION_WORKERS, thread_name_prefix='aggregation')
+        return _pool
+
+
+# Fonction pour découper une table en partitions équilibrées : par pays pour les agrégats détaillés
+# (évite de refusionner de gros résultats partiels), sinon par plages de lignes (sans copie)
+def partitions(table, keys, count):
+    size = len(table)
+    if PARTITION_KEY in keys and not set(keys) <= LOW_CARDINALITY_KEYS:
+        country = table[PARTITION_KEY].to_numpy()
+        order = np.argsort(country, kind='stable')
+        sorted_country = country[order]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(sorted_country)) + 1, [size]))
+        targets = np.linspace(0, size, count + 1)
+        cuts = np.unique(bounds[np.clip(np.searchsorted(bounds, targets), 0, len(bounds) - 1)])
+        return [order[start:stop] for start, stop in zip(cuts[:-1], cuts[1:])], True
+    cuts = np.linspace(0, size, count + 1).astype(np.int64)
+    return [slice(start, stop) for start, stop in zip(cuts[:-1], cuts[1:]) if stop > start], False
+
+
+def sum_serial(table, keys, measures):
+    return table.groupby(keys, sort=False)[measures].sum().reset_index()
+
+
+# Fonction pour sommer des mesures par clés, en parallèle sur des partitions quand la table est assez grande
+def sum_by(table, keys, measures):
+    if get_mode() == 'serial' or AGGREGATION_WORKERS < 2 or len(table) < PARALLEL_MIN_ROWS:
+        return sum_serial(table, keys, measures)
+    parts, disjoint = partitions(table, keys, AGGREGATION_WORKERS)
+    if len(parts) < 2:
+        return sum_serial(table, keys, measures)
+
+    def aggregate(rows):
+        part = table.iloc[rows] if isinstance(rows, slice) else table.take(rows)
+        return sum_serial(part, keys, measures)
+
+    partials = pd.concat(list(get_pool().map(aggregate, parts)), ignore_index=True)
+    # Partitions par plages de lignes : un même groupe peut apparaître dans plusieurs résultats partiels
+    return partials if disjoint else sum_serial(partials, keys, measures)
+
+
+# Fonction pour mesurer chaque agrégation en série puis en parallèle
+def compare_modes(workloads, repeat=3):
+    rows = []
+    for name, compute in workloads.items():
+        timings = {}
+        for mode in AGGREGATION_MODES:
+            with execution_mode(mode):
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    compute()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+            timings[mode] = best
+        rows.append({
+            'Agrégation': name,
+            'Série (s)': round(timings['serial'], 4),
+            'Parallèle (s)': round(timings['parallel'], 4),
+            'Accélération': round(timings['serial'] / timings['parallel'], 2) if timings['parallel'] else None,
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,79 @@
+import os
+
+from cube import CuboidUnavailableError
+from ingest import CHUNK_SIZE, read_sales_file
+from registry import build_dataset
+from star_schema import KEY_COLUMNS
+
+# Calculs des pages, sans Streamlit : utilisables depuis les pages, les scripts et les mesures de performance.
+# Les filtres sont des listes de libellés par dimension (Country, Month, CustomerID), None pour tout garder.
+
+
+# Fonction pour lire un fichier de ventes et construire le jeu de données (schéma en étoile, cube, catalogue)
+def load_dataset(path, key=None, name=None, chunksize=CHUNK_SIZE):
+    df, report = read_sales_file(path, os.path.basename(path), chunksize)
+    if key is None:
+        key = f"{os.path.abspath(path)}:{os.path.getmtime(path)}"
+    return build_dataset(df, key, name, report['profile']), report
+
+
+# Fonction pour calculer les indicateurs globaux : ventes, quantité, transactions et vente moyenne
+def sales_metrics(cube, **filters):
+    totals = cube.totals(**filters)
+    transactions = totals['Transactions']
+    return {
+        'total_sales': totals['MontantVentes'],
+        'total_quantity': totals['QuantiteVendue'],
+        'transactions': transactions,
+        'average_sale': totals['MontantVentes'] / transactions if transactions > 0 else 0,
+    }
+
+
+# Fonction pour compter les clients distincts : exact sur le cube, ou estimé par HyperLogLog (mode approché,
+# ou détail client abandonné lors d'une agrégation en flux) ; renvoie (nombre, erreur relative ou None)
+def distinct_customers(dataset, approx=False, **filters):
+    if not approx:
+        try:
+            return dataset.cube.distinct('CustomerID', **filters), None
+        except CuboidUnavailableError:
+            pass
+    return dataset.approx.distinct_customers(dataset.star, **filters)
+
+
+# Fonction pour calculer les ventes par pays et par mois, dans l'ordre des mois
+def sales_by_month_country(cube, **filters):
+    return cube.query(['Country', 'Month'], ['MontantVentes'], **filters).sort_values('MonthOrder')
+
+
+# Fonction pour classer les produits par ventes décroissantes
+def product_sales(cube, **filters):
+    return cube.query(['ProductName'], ['MontantVentes'], **filters).sort_values('MontantVentes', ascending=False).reset_index(drop=True)
+
+
+# Fonction pour obtenir les n meilleurs produits : exacts, ou estimés par Misra-Gries en mode approché ;
+# renvoie (tableau, borne de sous-estimation ou None)
+def top_products(dataset, n=10, approx=False, **filters):
+    if approx:
+        return dataset.approx.top_products(dataset.star, n, **filters)
+    return product_sales(dataset.cube, **filters).head(n), None
+
+
+# Fonction pour classer les pays par ventes décroissantes
+def top_countries(cube, **filters):
+    return cube.query(['Country'], ['MontantVentes'], **filters).sort_values('MontantVentes', ascending=False).reset_index(drop=True)
+
+
+# Fonction pour calculer les ventes de chaque mois, dans l'ordre des mois
+def monthly_sales(cube, **filters):
+    return cube.query(['Month'], ['MontantVentes'], **filters).sort_values('MonthOrder')
+
+
+# Fonction pour calculer l'agrégat client × produit sur les clés (libellés joints à l'affichage)
+def customer_product_keys(cube, **filters):
+    return cube.query_keys(['CustomerID', 'ProductName'], ['QuantiteVendue'], **filters)
+
+
+# Fonction pour restreindre un agrégat sur les clés à une liste de clients (libellés)
+def select_customers(star, table, customers):
+    key = KEY_COLUMNS['CustomerID']
+    return table[table[key].isin(star.keys_for('CustomerID', customers))].reset_index(drop=True)
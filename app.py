@@ -1,10 +1,37 @@
 import streamlit as st
-import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-import base64
+import logging
 import os
+import threading
+import time
 from pathlib import Path
+from ingest import EXCEL_WORKERS, MissingColumnsError, read_sales_file, format_bytes, preview_source
+from profiling import profile_frame
+import store
+import snapshot
+from ingest import MEASURE_COLUMNS
+from registry import Dataset, DatasetRegistry, build_dataset
+from cube import CuboidUnavailableError, aggregation_workloads
+import aggregation
+from streaming import stream_dataset
+from jobs import IngestJobManager
+from merge import merge_sources
+from customer_report import PAGE_SIZES, SORT_COLUMNS, page_rows, sort_order, top_customers
+from export import EXPORT_FORMATS, EXPORT_MAX_SERVED_BYTES, export_file, export_url, iter_labeled_chunks
+from result_cache import ResultCache, canonical_filters
+from query_api import QUERY_API_ENABLED, QueryService
+import analytics
+from panels import PanelGraph
+from instrumentation import PROFILE_DEFAULT, PROFILE_LOG, cached_stage, finish_run, read_log, stage, start_run
+from charts import (MAX_SERIES, country_month_figure, country_pies_figure, figure_within_budget, line_figure, load_figure,
+                    monthly_stack_figure, rank_values, top_products_figure)
+
+# Journal des événements du serveur (démarrage, service de requêtes) ; ils sont aussi affichés sur la page Admin
+logger = logging.getLogger('ventes')
+
+# Vues du tableau de bord
+DASHBOARD_VIEWS = ["Ventes par Pays", "Ventes Mensuelles", "Ventes par Produit", "Répartition par Pays"]
 
 # Configuration de la page Streamlit
 st.set_page_config(
@@ -145,61 +172,325 @@ def add_bg_and_styling():
     </style>
     """, unsafe_allow_html=True)
 
-# Fonction pour charger les données
-@st.cache_data
-def load_data(uploaded_file=None):
+# Registre des jeux de données, partagé par toutes les sessions du serveur
+@st.cache_resource
+def get_registry():
+    max_mb = int(os.environ.get('VENTES_MEMORY_CAP_MB', '1024'))
+    return DatasetRegistry(max_mb * 1024 * 1024)
+
+# Cache des résultats dérivés (agrégats filtrés), partagé par toutes les sessions
+@st.cache_resource
+def get_result_cache():
+    max_mb = int(os.environ.get('VENTES_RESULT_CACHE_MB', '256'))
+    return ResultCache(max_mb * 1024 * 1024)
+
+# Fonction pour précalculer les résultats de la première vue du tableau de bord (filtres par défaut : tout le jeu),
+# avec les mêmes clés que cached_result et cached_figure
+def prewarm_dashboard(dataset, cache):
+    months = dataset.catalog.values('Month')
+    filters = {'Country': dataset.catalog.values('Country'), 'Month': months}
+    def cached(name, compute):
+        return cache.get_or_compute((dataset.key, name, canonical_filters(filters)), compute)
+    cached('sales_metrics', lambda: analytics.sales_metrics(dataset.cube, **filters))
+    sales = cached('sales_by_month_country', lambda: analytics.sales_by_month_country(dataset.cube, **filters))
+    cached('num_customers', lambda: analytics.distinct_customers(dataset, False, **filters))
+    cached('fig_country_month', lambda: figure_within_budget(
+        lambda max_series: country_month_figure(sales, months, max_series, [])))
+
+# Fonction de démarrage à chaud : restauration du jeu actif puis précalcul de la première vue du tableau de bord
+def warm_start(registry, cache, key, name):
     try:
-        if uploaded_file is None:
-            if 'data' in st.session_state and st.session_state.data is not None:
-                return st.session_state.data
-            st.error("Aucun fichier de données n'a été uploadé.")
-            st.info("Veuillez télécharger votre fichier dans la section 'Browse Files'.")
-            return pd.DataFrame()
-        
-        # Charger le fichier uploadé
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
-        
-        # Vérification des colonnes nécessaires
-        required_columns = ['Country', 'Month', 'CustomerID', 'ProductName', 'QuantiteVendue', 'MontantVentes']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            st.error(f"Les colonnes suivantes sont manquantes dans votre fichier : {', '.join(missing_columns)}")
+        dataset = registry.get_or_load(key, name)
+        if dataset is not None:
+            prewarm_dashboard(dataset, cache)
+    except Exception as e:
+        logger.warning("Démarrage : restauration de %s impossible : %s", name, e)
+
+# Démarrage du serveur : le jeu actif du stock est restauré en arrière-plan (depuis son instantané s'il existe)
+# pendant que la première page s'affiche ; les temps de premier affichage de chaque page sont conservés
+@st.cache_resource
+def get_startup():
+    startup = {'started': time.perf_counter(), 'warm': None, 'active': None, 'first_pages': {}}
+    name = store.get_active()
+    if name is not None:
+        startup['active'] = (store.dataset_key(store.read_meta(name)), name)
+        startup['warm'] = threading.Thread(target=warm_start, args=(get_registry(), get_result_cache()) + startup['active'],
+                                           daemon=True)
+        startup['warm'].start()
+    return startup
+
+# Fonction pour reprendre dans une nouvelle session le jeu actif du stock au moment de son ouverture (et non celui
+# du démarrage du serveur : get_startup ne sert qu'au précalcul du démarrage)
+def restore_active_dataset():
+    name = store.get_active()
+    if name is None:
+        return
+    try:
+        key = store.dataset_key(store.read_meta(name))
+    except FileNotFoundError:
+        # Jeu remplacé au même instant par une autre session : la session démarre sans jeu actif
+        return
+    st.session_state.dataset_key, st.session_state.dataset_name = key, name
+
+# Fonction pour noter le premier affichage d'une page depuis le démarrage, et l'annoncer dans le journal du serveur
+def record_first_page(page, render_seconds):
+    startup = get_startup()
+    if page in startup['first_pages']:
+        return
+    since_start = time.perf_counter() - startup['started']
+    startup['first_pages'][page] = {'since_start': since_start, 'render': render_seconds}
+    logger.info("Démarrage : premier affichage de %s en %.0f ms (%.1f s après le démarrage)",
+                page, render_seconds * 1000, since_start)
+
+# Service local de requêtes d'agrégats (HTTP), partagé par toutes les sessions ; il sert le dernier jeu activé
+@st.cache_resource
+def get_query_service():
+    service = QueryService(get_registry(), get_result_cache())
+    if QUERY_API_ENABLED:
+        try:
+            service.start()
+            logger.info("API : requêtes d'agrégats servies sur %s", service.url)
+        except OSError as e:
+            # Port déjà pris (autre instance de l'application) : le tableau de bord fonctionne sans le service
+            service.error = e
+            logger.warning("API : démarrage impossible : %s", e)
+    return service
+
+# Imports en arrière-plan, partagés par toutes les sessions
+@st.cache_resource
+def get_ingest_jobs():
+    return IngestJobManager(get_registry())
+
+# Fonction pour obtenir un résultat dérivé, calculé une seule fois par jeu de données et par filtres
+def cached_result(dataset, name, filters, compute):
+    key = (dataset.key, name, canonical_filters(filters))
+    return cached_stage(name, lambda compute: get_result_cache().get_or_compute(key, compute), compute)
+
+# Fonction pour récupérer une figure mise en cache sous forme JSON (construite à la première demande) ;
+# build(max_series) est réduite au besoin pour respecter le budget de taille des figures
+def cached_figure(dataset, name, filters, build):
+    def measured_build(max_series):
+        with stage(f"Construction de {name}"):
+            return build(max_series)
+    return load_figure(cached_result(dataset, name, filters, lambda: figure_within_budget(measured_build)))
+
+# Fonction pour afficher une figure (sérialisation Plotly et envoi au navigateur mesurés)
+def show_chart(fig):
+    with stage("Rendu Plotly"):
+        st.plotly_chart(fig, use_container_width=True)
+
+# Fonction pour afficher le panneau de diagnostic de l'exécution et les dernières exécutions du journal
+def show_profile_panel(run):
+    with st.expander(f"Diagnostic de l'exécution : {run.total_seconds * 1000:,.0f} ms"):
+        st.dataframe(run.frame(), hide_index=True, use_container_width=True,
+                     column_config={'Durée (ms)': st.column_config.NumberColumn(format="%.1f"),
+                                    'Mémoire allouée (Ko)': st.column_config.NumberColumn(format="%.1f"),
+                                    'Pic (Ko)': st.column_config.NumberColumn(format="%.1f")})
+        history = pd.DataFrame([{'Page': entry['page'], 'Durée (ms)': entry['total_seconds'] * 1000}
+                                for entry in read_log()])
+        if not history.empty:
+            summary = history.groupby('Page')['Durée (ms)'].agg(['count', 'median', 'max']).round(1)
+            st.dataframe(summary.rename(columns={'count': 'Exécutions', 'median': 'Médiane (ms)', 'max': 'Max (ms)'}),
+                         use_container_width=True)
+        reused = [entry for entry in run.stages if entry.get('cache') == 'réutilisé']
+        if reused:
+            saved = sum(entry['saved_seconds'] for entry in reused)
+            st.caption(f"{len(reused)} panneaux réutilisés sans recalcul : {saved * 1000:,.1f} ms de calcul évités")
+        st.caption(f"Journal : {os.path.abspath(PROFILE_LOG)} (une ligne JSON par exécution)")
+
+# Fonction pour décrire des colonnes manquantes, avec la feuille Excel concernée
+def missing_columns_message(error, where="votre fichier"):
+    if error.sheet is not None:
+        where = f"la feuille « {error.sheet} » de {where}"
+    return f"Les colonnes suivantes sont manquantes dans {where} : {', '.join(error.missing)}"
+
+# Fonction pour afficher le débit de lecture de chaque feuille d'un classeur Excel
+def show_sheet_report(sheets):
+    if not sheets:
+        return
+    read = sum(sheet['Statut'] == "lue" for sheet in sheets)
+    ignored = f", {len(sheets) - read} ignorée(s)" if read < len(sheets) else ""
+    st.caption(f"{read} feuille(s) lue(s) en flux{ignored}, jusqu'à {min(EXCEL_WORKERS, len(sheets))} en parallèle :")
+    table = pd.DataFrame(sheets)
+    table['Lecture (s)'] = table['Lecture (s)'].round(2)
+    table['Lignes/s'] = pd.to_numeric(table['Lignes/s']).round(0)
+    st.dataframe(table, hide_index=True)
+
+# Fonction pour calculer une seule fois l'empreinte du contenu d'un fichier uploadé
+def uploaded_file_key(uploaded_file):
+    hashes = st.session_state.setdefault('upload_hashes', {})
+    if uploaded_file.file_id not in hashes:
+        hashes[uploaded_file.file_id] = store.content_hash(uploaded_file.getvalue())
+    return hashes[uploaded_file.file_id]
+
+# Fonction pour lire un fichier uploadé en DataFrame compact, avec le rapport de lecture (profil des colonnes)
+def read_uploaded_file(uploaded_file):
+    try:
+        # Charger le fichier uploadé par blocs, avec un schéma typé et compact
+        try:
+            df, report = read_sales_file(uploaded_file, uploaded_file.name)
+        except MissingColumnsError as e:
+            st.error(missing_columns_message(e))
             st.error("Veuillez uploader un fichier avec les colonnes requises.")
-            return pd.DataFrame()
+            return None, None
         
-        # Création de MonthOrder si absent
-        if 'MonthOrder' not in df.columns:
-            months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-            month_order = {month: i for i, month in enumerate(months)}
-            if set(df['Month'].unique()).issubset(set(months)):
-                df['MonthOrder'] = df['Month'].map(month_order)
-            else:
-                st.warning("Format des mois non reconnu. Ordre chronologique peut être incorrect.")
-                unique_months = df['Month'].unique()
-                custom_order = {month: i for i, month in enumerate(unique_months)}
-                df['MonthOrder'] = df['Month'].map(custom_order)
+        if not report['months_recognized']:
+            st.warning("Format des mois non reconnu. Ordre chronologique peut être incorrect.")
         
         st.success(f"Données chargées avec succès depuis {uploaded_file.name}")
-        return df
+        st.caption(f"Mémoire utilisée : {format_bytes(report['raw_bytes'])} avant compactage, "
+                   f"{format_bytes(report['compact_bytes'])} après ({report['rows']:,} lignes)")
+        show_sheet_report(report.get('sheets'))
+        return df, report
     except Exception as e:
         st.error(f"Erreur lors du chargement des données : {e}")
-        return pd.DataFrame()
+        return None, None
 
-# Fonction pour sauvegarder un fichier uploadé
-def save_uploaded_file(uploaded_file):
+# Fonction pour charger les données ; un contenu déjà connu du registre n'est pas relu
+def load_data(uploaded_file=None):
+    if uploaded_file is None:
+        dataset = get_active_dataset()
+        if dataset is None:
+            st.error("Aucun fichier de données n'a été uploadé.")
+            st.info("Veuillez télécharger votre fichier dans la section 'Browse Files'.")
+        return dataset
+    
+    key = uploaded_file_key(uploaded_file)
+    dataset = get_registry().get_or_load(key)
+    if dataset is None:
+        # Import en arrière-plan : le jeu actif reste utilisable jusqu'à la fin de l'import
+        job = get_ingest_jobs().get(st.session_state.get('ingest_job_id'))
+        retry = st.session_state.pop('ingest_retry', False)
+        if job is None or job.key != key or retry:
+            job = get_ingest_jobs().submit(key, uploaded_file.name, uploaded_file.getvalue())
+            st.session_state.ingest_job_id = job.id
+    return dataset
+
+# Fonction pour activer le jeu importé en arrière-plan dès qu'il est prêt
+def poll_ingest_job():
+    job = get_ingest_jobs().get(st.session_state.get('ingest_job_id'))
+    if job is not None and job.status == 'done' and st.session_state.get('dataset_key') != job.key:
+        dataset = get_registry().get(job.key) or job.dataset
+        activate_dataset(dataset)
+        st.session_state.ingest_done = job.id
+
+# Fonction pour afficher l'avancement d'un import en arrière-plan
+def show_ingest_job(job):
+    if job.active:
+        st.progress(job.fraction, text=f"Import de {job.filename} : {job.stage}")
+        st.caption(f"{job.rows:,} lignes lues en {job.elapsed:.1f} s. "
+                   "Les autres pages restent utilisables avec le jeu de données actuel.")
+        if st.button("Annuler l'import"):
+            job.cancel()
+        return
+    if job.status == 'cancelled':
+        st.info(f"Import de {job.filename} annulé.")
+        if st.button("Relancer l'import"):
+            st.session_state.ingest_retry = True
+            st.rerun()
+    elif job.status == 'failed':
+        if isinstance(job.error, MissingColumnsError):
+            st.error(missing_columns_message(job.error))
+            st.error("Veuillez uploader un fichier avec les colonnes requises.")
+        else:
+            st.error(f"Erreur lors du chargement des données : {job.error}")
+    elif st.session_state.get('ingest_done') == job.id:
+        report = job.report
+        if not report['months_recognized']:
+            st.warning("Format des mois non reconnu. Ordre chronologique peut être incorrect.")
+        st.success(f"Données chargées avec succès depuis {job.filename} en {job.elapsed:.1f} s")
+        st.caption(f"Mémoire utilisée : {format_bytes(report['raw_bytes'])} avant compactage, "
+                   f"{format_bytes(report['compact_bytes'])} après ({report['rows']:,} lignes)")
+        show_sheet_report(report.get('sheets'))
+
+# Fonction pour obtenir le jeu de données actif : la session ne garde qu'une référence
+def get_active_dataset():
+    key = st.session_state.get('dataset_key')
+    if key is None:
+        return None
+    with stage("Chargement du jeu de données"):
+        warm = get_startup()['warm']
+        if warm is not None and warm.is_alive() and get_startup()['active'][0] == key:
+            # Restauration du démarrage en cours : on l'attend plutôt que de charger le jeu une seconde fois
+            warm.join()
+        dataset = get_registry().get_or_load(key, st.session_state.get('dataset_name'))
+    if dataset is not None and dataset.key != key:
+        activate_dataset(dataset)
+    return dataset
+
+# Fonction pour activer un jeu de données dans la session
+def activate_dataset(dataset):
+    st.session_state.dataset_key = dataset.key
+    st.session_state.dataset_name = dataset.name
+    get_query_service().publish(dataset)
+    if dataset.name is not None:
+        # Instantané écrit en arrière-plan pour le prochain démarrage (ignoré s'il est déjà à jour)
+        snapshot.save_snapshot_async(dataset.name, dataset)
+
+# Fonction pour sauvegarder un fichier uploadé dans le stock de données
+def save_uploaded_file(uploaded_file, dataset):
     try:
-        with open("merged_data.csv", "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        name = store.dataset_name(uploaded_file.name)
+        store.save_dataset(dataset.star.to_frame(), name, source=uploaded_file.name, batch_hash=dataset.key,
+                           profile=dataset.profile)
+        store.set_active(name)
+        dataset.name = name
+        activate_dataset(dataset)
         return True
     except Exception as e:
         st.error(f"Erreur lors de la sauvegarde du fichier : {e}")
         return False
 
+# Fonction pour ajouter un lot uploadé au jeu de données actif, agrégats mis à jour par delta
+def append_uploaded_batch(uploaded_file, dataset):
+    name = dataset.name
+    batch_hash = uploaded_file_key(uploaded_file)
+    if store.has_batch(name, batch_hash):
+        st.info(f"Le lot {uploaded_file.name} a déjà été ajouté à {name} : il est ignoré.")
+        return False
+    df, report = read_uploaded_file(uploaded_file)
+    if df is None:
+        return False
+    try:
+        meta = store.append_dataset(name, df, batch_hash=batch_hash, profile=report['profile'])
+    except store.DuplicateBatchError:
+        # Même lot ajouté entre-temps par une autre session (ou un double clic)
+        st.info(f"Le lot {uploaded_file.name} a déjà été ajouté à {name} : il est ignoré.")
+        return False
+    except store.SchemaMismatchError as e:
+        st.error(f"Le schéma du lot ne correspond pas à celui de {name} : {e}")
+        return False
+    except Exception as e:
+        st.error(f"Erreur lors de l'ajout du lot : {e}")
+        return False
+    if store.dataset_key(dict(meta, batches=meta['batches'][:-1])) != dataset.key:
+        # Une autre session a ajouté un lot entre-temps : la version en mémoire n'est pas celle qui a été complétée,
+        # la nouvelle version est relue depuis le stock
+        activate_dataset(get_registry().get_or_load(store.dataset_key(meta), name))
+        st.success(f"{len(df):,} lignes ajoutées à {name}.")
+        return True
+    # Nouvelle version immuable : les sessions qui utilisent l'ancienne ne sont pas affectées
+    star, batch = dataset.star.with_batch(df)
+    profile = dataset.profile.merge(report['profile']) if dataset.profile is not None else None
+    cube, deltas = dataset.cube.with_batch(star, batch)
+    # Esquisses mises à jour avec les seuls agrégats du lot
+    approx = dataset.approx.update(deltas[('Country', 'Month', 'CustomerID')], deltas[('Country', 'Month', 'ProductName')])
+    updated = Dataset(store.dataset_key(meta), star, cube, name, dataset.catalog.with_batch(star, batch), profile, approx)
+    activate_dataset(get_registry().put(updated))
+    st.success(f"{len(df):,} lignes ajoutées à {name}.")
+    return True
+
+run_started = time.perf_counter()
+get_startup()
+get_query_service()
+
+# Instrumentation de l'exécution en mode diagnostic (durée et mémoire de chaque étape)
+if st.session_state.get('profiling', PROFILE_DEFAULT):
+    start_run(st.session_state.get('page', 'home'))
+
 # Appliquer les styles
-add_bg_and_styling()
+with stage("Styles"):
+    add_bg_and_styling()
 
 # Définir les pages
 def page_home():
@@ -212,7 +503,8 @@ def page_home():
             ('Browse Files', 'browse_files', 'Parcourir les fichiers de données'),
             ('Create New', 'create_new', 'Créer une nouvelle analyse'),
             ('Manage Data Sources', 'manage_data', 'Gérer les sources de données'),
-            ('Documentation', 'documentation', 'Consulter la documentation')
+            ('Documentation', 'documentation', 'Consulter la documentation'),
+            ('Administration', 'admin', 'Voir les jeux de données en mémoire')
         ]:
             if st.button(label, key=f'btn_{page}', help=help_text, use_container_width=True):
                 st.session_state.page = page
@@ -265,7 +557,7 @@ def page_home():
     * **Dashboard**: Tableau de bord visuel avec graphiques interactifs
     """)
     
-    if 'data' in st.session_state and st.session_state.data is not None:
+    if get_active_dataset() is not None:
         st.success("Données chargées. Vous pouvez accéder aux analyses.")
     else:
         st.warning("Aucune donnée chargée. Veuillez uploader un fichier dans 'Browse Files'.")
@@ -280,6 +572,18 @@ def page_browse_files():
     st.markdown('<div class="main-header"><h1>Browse Files</h1></div>', unsafe_allow_html=True)
     st.markdown('<div class="card">', unsafe_allow_html=True)
     
+    active_dataset = get_active_dataset()
+    active_name = active_dataset.name if active_dataset is not None else None
+    mode = st.radio("Mode d'import", ["Remplacer les données", "Ajouter un lot au jeu de données actif"],
+                    horizontal=True)
+    append_mode = mode == "Ajouter un lot au jeu de données actif"
+    if append_mode and active_name is None:
+        st.info("Aucun jeu de données stocké n'est actif. Sauvegardez d'abord un fichier ou choisissez-en un dans 'Manage Data Sources'.")
+    elif append_mode and active_dataset.streamed:
+        # Pas de table de faits à compléter : le fichier source doit être agrégé à nouveau
+        st.info(f"{active_name} est agrégé en flux : il ne reçoit pas de lots. Agrégez à nouveau le fichier source complété.")
+        active_name = None
+    
     uploaded_file = st.file_uploader("Téléchargez votre fichier de données", type=["csv", "xlsx", "xls"])
     
     if uploaded_file is not None:
@@ -287,25 +591,47 @@ def page_browse_files():
         st.write(f"Type du fichier : {uploaded_file.type}")
         st.write(f"Taille du fichier : {uploaded_file.size} bytes")
         
-        df = load_data(uploaded_file)
-        if not df.empty:
-            st.session_state.data = df
-            st.write("Aperçu des données :")
-            st.dataframe(df.head())
-            st.write("Statistiques des données :")
-            st.write(df.describe())
-            st.write("Colonnes disponibles :")
-            st.write(", ".join(df.columns.tolist()))
-            
-            if st.button("Utiliser ce fichier comme source de données"):
-                if save_uploaded_file(uploaded_file):
-                    st.success(f"Fichier {uploaded_file.name} sauvegardé comme source de données.")
-                    st.rerun()
+        if append_mode:
+            # Le lot n'est lu qu'au moment de l'ajout
+            if active_name is not None and st.button(f"Ajouter ce lot à {active_name}"):
+                append_uploaded_batch(uploaded_file, active_dataset)
+        else:
+            dataset = load_data(uploaded_file)
+            job = get_ingest_jobs().get(st.session_state.get('ingest_job_id'))
+            if job is not None and job.key == uploaded_file_key(uploaded_file):
+                show_ingest_job(job)
+            if dataset is not None:
+                if st.session_state.get('dataset_key') != dataset.key:
+                    activate_dataset(dataset)
+                preview = dataset.star.head()
+                st.write("Aperçu des données :")
+                st.dataframe(preview)
+                st.write("Statistiques des données :")
+                if dataset.profile is not None:
+                    # Profil calculé pendant l'import : rien n'est recalculé à l'affichage
+                    st.dataframe(profile_frame(dataset.profile.summary()), hide_index=True)
+                else:
+                    st.write(cached_result(dataset, 'describe', {}, lambda: dataset.star.fact[MEASURE_COLUMNS].describe()))
+                st.write("Colonnes disponibles :")
+                st.write(", ".join(preview.columns.tolist()))
+                st.write("Dimensions :")
+                st.dataframe(dataset.catalog.summary(), hide_index=True)
+                
+                if st.button("Utiliser ce fichier comme source de données"):
+                    if save_uploaded_file(uploaded_file, dataset):
+                        st.success(f"Fichier {uploaded_file.name} sauvegardé comme source de données.")
+                        st.rerun()
     
     st.markdown("Cette section vous permet de parcourir et de télécharger vos fichiers de données pour analyse.")
     if st.button("Retour à l'accueil"):
         st.session_state.page = 'home'
     st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Rafraîchissement tant qu'un import est en cours
+    job = get_ingest_jobs().get(st.session_state.get('ingest_job_id'))
+    if st.session_state.page == 'browse_files' and job is not None and job.active:
+        time.sleep(0.5)
+        st.rerun()
 
 def page_create_new():
     st.markdown('<div class="main-header"><h1>Create New Analysis</h1></div>', unsafe_allow_html=True)
@@ -319,43 +645,173 @@ def page_manage_data():
     st.markdown('<div class="main-header"><h1>Manage Data Sources</h1></div>', unsafe_allow_html=True)
     st.markdown('<div class="card">', unsafe_allow_html=True)
     
+    st.subheader("Jeux de données stockés")
+    datasets = store.list_datasets()
+    active = store.get_active()
+    if datasets:
+        for meta in datasets:
+            name = meta['name']
+            col1, col2, col3 = st.columns([3, 1, 1])
+            with col1:
+                marker = " (actif)" if name == active else ""
+                if meta.get('streamed'):
+                    st.write(f"🗄️ {name}{marker} — {meta['rows']:,} lignes, agrégé en flux (cube seulement)")
+                    st.caption(f"Source : {meta['source']} — pas de lignes de ventes stockées, ni aperçu ni ajout de lots")
+                else:
+                    st.write(f"🗄️ {name}{marker} — {meta['rows']:,} lignes, {format_bytes(meta['size_bytes'])}")
+                    st.caption(", ".join(f"{col}: {dtype}" for col, dtype in meta['columns'].items()))
+            with col2:
+                if not meta.get('streamed') and st.button(f"Aperçu", key=f"preview_store_{name}"):
+                    try:
+                        st.session_state.preview_file = name
+                        st.session_state.preview_df = store.preview_dataset(name)
+                        st.session_state.preview_rows = meta['rows']
+                        st.session_state.preview_profile = meta.get('profile')
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Erreur lors de la lecture du jeu de données : {e}")
+            with col3:
+                if st.button(f"Utiliser", key=f"use_store_{name}"):
+                    try:
+                        dataset = get_registry().get_or_load(store.dataset_key(meta), name)
+                        if dataset is None:
+                            st.error(f"L'instantané de {name} est introuvable : agrégez à nouveau {meta['source']} en flux.")
+                            continue
+                        activate_dataset(dataset)
+                        store.set_active(name)
+                        st.success(f"Le jeu de données {name} est maintenant utilisé comme source de données principale.")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Erreur lors de la définition du jeu de données comme source principale : {e}")
+    else:
+        st.info("Aucun jeu de données stocké. Utilisez un fichier ci-dessous ou dans 'Browse Files' pour l'ajouter.")
+    
     st.subheader("Fichiers de données disponibles")
-    files = [f for f in os.listdir('.') if f.endswith(('.csv', '.xlsx', '.xls'))]
+    files = [f for f in os.listdir('.') if f.endswith(('.csv', '.xlsx', '.xls', '.parquet'))]
     if files:
         for file in files:
-            col1, col2, col3 = st.columns([3, 1, 1])
+            col1, col2, col3, col4 = st.columns([3, 1, 1, 1])
             with col1:
                 st.write(f"📄 {file}")
             with col2:
                 if st.button(f"Aperçu", key=f"preview_{file}"):
                     try:
-                        df = pd.read_csv(file) if file.endswith('.csv') else pd.read_excel(file)
+                        # Seul le début du fichier est lu ; le nombre de lignes d'un gros CSV est estimé,
+                        # sauf s'il a déjà été stocké tel quel
+                        df, rows, estimated = preview_source(file)
+                        meta = store.find_source(file)
+                        if meta is not None:
+                            rows, estimated = meta['rows'], False
                         st.session_state.preview_file = file
                         st.session_state.preview_df = df
+                        if rows is None:
+                            st.session_state.preview_rows = "inconnu"
+                        else:
+                            st.session_state.preview_rows = f"environ {rows:,} (estimation)" if estimated else rows
+                        st.session_state.pop('preview_profile', None)
                         st.rerun()
                     except Exception as e:
                         st.error(f"Erreur lors de la lecture du fichier : {e}")
             with col3:
                 if st.button(f"Utiliser", key=f"use_{file}"):
                     try:
-                        df = pd.read_csv(file) if file.endswith('.csv') else pd.read_excel(file)
-                        st.session_state.data = df
-                        df.to_csv("merged_data.csv", index=False)
+                        key = store.content_hash(file)
+                        name = store.find_dataset(key)
+                        if name is None:
+                            df, report = read_sales_file(file, file)
+                            name = store.dataset_name(file)
+                            store.save_dataset(df, name, source=file, batch_hash=key, profile=report['profile'])
+                            dataset = get_registry().put(build_dataset(df, key, name, report['profile']))
+                            st.session_state.sheet_report = {'file': file, 'sheets': report.get('sheets')}
+                        else:
+                            dataset = get_registry().get_or_load(key, name)
+                        store.set_active(name)
+                        activate_dataset(dataset)
                         st.success(f"Le fichier {file} est maintenant utilisé comme source de données principale.")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Erreur lors de la définition du fichier comme source principale : {e}")
+            with col4:
+                # Agrégation bloc par bloc, sans charger le fichier : seul le cube est conservé
+                if file.endswith(('.csv', '.parquet', '.xlsx')) and st.button("Agréger en flux", key=f"stream_{file}"):
+                    try:
+                        dataset, report = stream_dataset(file)
+                        # Le cube est enregistré aussitôt (métadonnées et instantané) : le jeu survit à
+                        # l'éviction du registre et au redémarrage
+                        name = f"{store.dataset_name(file)}_flux"
+                        dataset.name = name
+                        store.save_streamed(name, dataset.key, report['rows'], source=file, profile=dataset.profile)
+                        snapshot.save_snapshot(name, dataset)
+                        store.set_active(name)
+                        activate_dataset(get_registry().put(dataset))
+                        st.session_state.stream_report = dict(report, file=file)
+                        st.rerun()
+                    except MissingColumnsError as e:
+                        st.error(missing_columns_message(e, file))
+                    except Exception as e:
+                        st.error(f"Erreur lors de l'agrégation en flux : {e}")
+        
+        report = st.session_state.get('sheet_report')
+        if report is not None and report['sheets']:
+            st.info(f"Lecture de {report['file']} :")
+            show_sheet_report(report['sheets'])
+        
+        report = st.session_state.get('stream_report')
+        if report is not None:
+            st.info(f"Agrégation en flux de {report['file']} : {report['rows']:,} lignes en {report['chunks']} blocs "
+                    f"de {report['chunk_rows']:,} lignes, {report['seconds']:.1f} s, mémoire maximale estimée "
+                    f"{format_bytes(report['peak_bytes'])} (plafond {format_bytes(report['memory_limit'])}).")
+            if report['dropped']:
+                st.warning("Détails abandonnés pour respecter le plafond mémoire : " + ", ".join(report['dropped']))
+            if report['peak_bytes'] > report['memory_limit']:
+                st.warning(f"Le plafond mémoire n'a pas pu être respecté : les libellés et clés des dimensions "
+                           f"occupent à eux seuls {format_bytes(report['dims_bytes'])}. Augmentez "
+                           f"VENTES_STREAM_MEMORY_MB pour ce fichier.")
+        
+        st.subheader("Fusionner des sources")
+        mergeable = [f for f in files if f.endswith(('.csv', '.xlsx', '.xls'))]
+        selected_files = st.multiselect("Fichiers à fusionner", options=mergeable)
+        merge_name = st.text_input("Nom du jeu de données fusionné", value="fusion")
+        if st.button("Fusionner les sources sélectionnées", disabled=len(selected_files) < 2):
+            try:
+                df, key, report = merge_sources(selected_files)
+                name = store.dataset_name(merge_name)
+                store.save_dataset(df, name, source=", ".join(selected_files), batch_hash=key, profile=report['profile'])
+                store.set_active(name)
+                activate_dataset(get_registry().put(build_dataset(df, key, name, report['profile'])))
+                st.session_state.merge_report = dict(report, name=name)
+                st.rerun()
+            except store.SchemaMismatchError as e:
+                st.error(f"Les fichiers n'ont pas le même schéma : {e}")
+            except MissingColumnsError as e:
+                st.error(missing_columns_message(e, "l'un des fichiers sélectionnés"))
+            except Exception as e:
+                st.error(f"Erreur lors de la fusion des fichiers : {e}")
+        
+        report = st.session_state.get('merge_report')
+        if report is not None:
+            st.success(f"{len(report['files'])} fichiers fusionnés dans {report['name']} : {report['rows']:,} lignes, "
+                       f"{report['removed']:,} doublons retirés, {report['seconds']:.2f} s "
+                       f"({report['rows_per_second']:,.0f} lignes/s, {format_bytes(report['bytes_per_second'])}/s)")
+            if not report['months_recognized']:
+                st.warning("Format des mois non reconnu. Ordre chronologique peut être incorrect.")
+            st.dataframe(report['files'].assign(Taille=report['files']['Taille'].map(format_bytes)),
+                         hide_index=True, use_container_width=True)
     else:
         st.info("Aucun fichier de données disponible. Veuillez télécharger un fichier dans la section 'Browse Files'.")
     
     if 'preview_file' in st.session_state and 'preview_df' in st.session_state:
         st.subheader(f"Aperçu de {st.session_state.preview_file}")
         st.dataframe(st.session_state.preview_df.head())
-        st.write(f"Nombre total de lignes : {len(st.session_state.preview_df)}")
+        st.write(f"Nombre total de lignes : {st.session_state.get('preview_rows', len(st.session_state.preview_df))}")
         st.write(f"Colonnes disponibles : {', '.join(st.session_state.preview_df.columns.tolist())}")
+        if st.session_state.get('preview_profile'):
+            st.dataframe(profile_frame(st.session_state.preview_profile), hide_index=True)
         if st.button("Fermer l'aperçu"):
             del st.session_state.preview_file
             del st.session_state.preview_df
+            st.session_state.pop('preview_rows', None)
+            st.session_state.pop('preview_profile', None)
             st.rerun()
     
     st.markdown("Cette section vous permet de gérer vos sources de données pour les analyses.")
@@ -392,65 +848,85 @@ def page_documentation():
         st.session_state.page = 'home'
     st.markdown('</div>', unsafe_allow_html=True)
 
+# Fonction pour construire la courbe des ventes mensuelles du rapport d'analyse
+def monthly_sales_figure(monthly_sales):
+    fig = line_figure(monthly_sales, x='Month', y='MontantVentes',
+                      labels={'MontantVentes': 'Ventes Totales', 'Month': 'Mois'},
+                      markers=True)
+    fig.update_layout(xaxis_title="Mois", yaxis_title="Ventes Totales", height=500)
+    return fig
+
 def page_analysis_report():
     st.markdown('<div class="main-header"><h1>Analysis Report</h1></div>', unsafe_allow_html=True)
     
-    if 'data' not in st.session_state or st.session_state.data is None:
+    dataset = get_active_dataset()
+    if dataset is None:
         st.error("Aucune donnée disponible. Veuillez importer un fichier de données valide dans 'Browse Files'.")
         if st.button("Retour à l'accueil"):
             st.session_state.page = 'home'
         return
     
-    df = st.session_state.data
+    cube = dataset.cube
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.write("## Rapport d'analyse des ventes")
     
-    total_sales = df['MontantVentes'].sum()
-    avg_sales = df['MontantVentes'].mean()
-    total_quantity = df['QuantiteVendue'].sum()
+    graph = PanelGraph(get_result_cache(), 'analysis_report')
+    graph.input('dataset', dataset.key)
+    metrics = graph.node('Indicateurs', ['dataset'], lambda: analytics.sales_metrics(cube))
     
     col1, col2, col3 = st.columns(3)
-    col1.metric("Ventes Totales", f"{total_sales:,.2f} €")
-    col2.metric("Vente Moyenne", f"{avg_sales:.2f} €")
-    col3.metric("Quantité Totale", f"{total_quantity}")
+    col1.metric("Ventes Totales", f"{metrics['total_sales']:,.2f} €")
+    col2.metric("Vente Moyenne", f"{metrics['average_sale']:.2f} €")
+    col3.metric("Quantité Totale", f"{metrics['total_quantity']}")
     
     st.write("### Top des pays par ventes")
-    top_countries = df.groupby('Country')['MontantVentes'].sum().sort_values(ascending=False).reset_index()
+    top_countries = graph.node('Classement des pays', ['dataset'], lambda: analytics.top_countries(cube))
     st.dataframe(top_countries, use_container_width=True)
     
     st.write("### Évolution mensuelle des ventes")
-    monthly_sales = df.groupby(['Month', 'MonthOrder'])['MontantVentes'].sum().reset_index().sort_values('MonthOrder')
-    
-    fig = px.line(monthly_sales, x='Month', y='MontantVentes',
-                 labels={'MontantVentes': 'Ventes Totales', 'Month': 'Mois'},
-                 markers=True)
-    fig.update_layout(xaxis_title="Mois", yaxis_title="Ventes Totales", height=500)
-    st.plotly_chart(fig, use_container_width=True)
+    monthly_sales = graph.node('Ventes mensuelles', ['dataset'], lambda: analytics.monthly_sales(cube))
+    fig = graph.node('Graphique mensuel', ['Ventes mensuelles'], lambda: monthly_sales_figure(monthly_sales))
+    show_chart(fig)
     
     if st.button("Retour à l'accueil"):
         st.session_state.page = 'home'
     st.markdown('</div>', unsafe_allow_html=True)
 
+# Fonction pour libeller une page du rapport client × produit et construire son tableau Plotly
+def customer_page(rows, order, page, page_size, star):
+    visible = page_rows(rows, order, page, page_size, star)
+    fig_table = go.Figure(data=[go.Table(
+        header=dict(values=['ID Client', 'Nom du Produit', 'Quantité Achetée'],
+                   fill_color='royalblue', align='left', font=dict(color='white', size=12)),
+        cells=dict(values=[visible['CustomerID'], visible['ProductName'],
+                         visible['QuantiteVendue']],
+                  fill_color='lavender', align='left')
+    )])
+    fig_table.update_layout(height=min(800, 80 + 30 * len(visible)))
+    return visible, fig_table
+
 def page_interactive_report():
     st.markdown('<div class="main-header"><h1>Interactive Report</h1></div>', unsafe_allow_html=True)
     
-    if 'data' not in st.session_state or st.session_state.data is None:
+    dataset = get_active_dataset()
+    if dataset is None:
         st.error("Aucune donnée disponible. Veuillez importer un fichier de données valide dans 'Browse Files'.")
         if st.button("Retour à l'accueil"):
             st.session_state.page = 'home'
         return
     
-    df = st.session_state.data
+    cube = dataset.cube
+    catalog = dataset.catalog
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.write("## Filtres")
     
     col1, col2 = st.columns(2)
     with col1:
-        countries = sorted(df['Country'].unique())
+        countries = catalog.values('Country')
         selected_countries = st.multiselect("Sélectionner des pays", options=countries, default=countries)
     
     with col2:
-        months = sorted(df['Month'].unique(), key=lambda x: df[df['Month']==x]['MonthOrder'].iloc[0])
+        months = catalog.values('Month')
         selected_months = st.multiselect("Sélectionner des mois", options=months, default=months)
     
     if not selected_countries or not selected_months:
@@ -460,8 +936,24 @@ def page_interactive_report():
             st.session_state.page = 'home'
         return
     
-    filtered_df = df[df['Country'].isin(selected_countries) & df['Month'].isin(selected_months)]
-    if filtered_df.empty:
+    filters = {'Country': selected_countries, 'Month': selected_months}
+    # Graphe des panneaux : filtres → agrégat → sélection de clients → tri → page affichée
+    graph = PanelGraph(get_result_cache(), 'interactive_report')
+    graph.input('dataset', dataset.key)
+    graph.input('filters', filters)
+    try:
+        # Agrégat client × produit sur les clés : les libellés ne sont joints qu'aux lignes affichées
+        customer_product_keys = graph.node('Agrégat client × produit', ['dataset', 'filters'], lambda: cached_result(
+            dataset, 'customer_product_keys', filters,
+            lambda: analytics.customer_product_keys(cube, **filters)
+        ))
+    except CuboidUnavailableError:
+        st.warning("Le détail client × produit n'a pas été conservé lors de l'agrégation en flux de ce jeu de données.")
+        st.markdown('</div>', unsafe_allow_html=True)
+        if st.button("Retour à l'accueil"):
+            st.session_state.page = 'home'
+        return
+    if customer_product_keys.empty:
         st.warning("Aucune donnée correspond aux filtres sélectionnés.")
         st.markdown('</div>', unsafe_allow_html=True)
         if st.button("Retour à l'accueil"):
@@ -472,32 +964,103 @@ def page_interactive_report():
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.write("## Rapport des ventes par client et produit")
     
-    customer_product_sales = filtered_df.groupby(['CustomerID', 'ProductName'])['QuantiteVendue'].sum().reset_index()
-    customer_ids = sorted(customer_product_sales['CustomerID'].unique())
-    selected_customers = st.multiselect(
-        "Sélectionner des clients",
-        options=customer_ids,
-        default=customer_ids[:5] if len(customer_ids) >= 5 else customer_ids
-    )
-    
-    filtered_table_data = customer_product_sales[customer_product_sales['CustomerID'].isin(selected_customers)]
-    if not filtered_table_data.empty:
-        st.dataframe(filtered_table_data, use_container_width=True)
-        
-        fig_table = go.Figure(data=[go.Table(
-            header=dict(values=['ID Client', 'Nom du Produit', 'Quantité Achetée'],
-                       fill_color='royalblue', align='left', font=dict(color='white', size=12)),
-            cells=dict(values=[filtered_table_data['CustomerID'], filtered_table_data['ProductName'],
-                             filtered_table_data['QuantiteVendue']],
-                      fill_color='lavender', align='left')
-        )])
-        st.plotly_chart(fig_table, use_container_width=True)
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        prefix = st.text_input("Rechercher un client (début de l'identifiant)")
+    with col2:
+        top_n = int(st.number_input("Nombre de meilleurs clients", min_value=1, max_value=100, value=5))
+    with col3:
+        ranking = st.radio("Classés par", ["Chiffre d'affaires", "Quantité"])
+    measure = 'MontantVentes' if ranking == "Chiffre d'affaires" else 'QuantiteVendue'
+    graph.input('ranking', (measure, top_n))
+    best_customers = graph.node('Meilleurs clients', ['dataset', 'filters', 'ranking'], lambda: cached_result(
+        dataset, f'top_customers_{measure}_{top_n}', filters,
+        lambda: top_customers(cube, measure, top_n, **filters)
+    ))
+    # Sélection gardée hors du widget : elle survit aux changements d'options dus à la recherche ;
+    # elle appartient au jeu de données et repart des meilleurs clients quand le jeu actif change
+    selection_state = st.session_state.get('customer_selection')
+    if selection_state is None or selection_state['dataset'] != dataset.key:
+        selection_state = st.session_state.customer_selection = {
+            'dataset': dataset.key, 'customers': best_customers['CustomerID'].head(5).tolist()}
+    if st.button(f"Sélectionner les {top_n} meilleurs clients"):
+        selection_state['customers'] = best_customers['CustomerID'].tolist()
+    with st.expander(f"Les {top_n} meilleurs clients ({ranking.lower()})"):
+        st.dataframe(best_customers, hide_index=True, use_container_width=True)
+    
+    # Recherche par préfixe dans l'index trié des clients : seules les correspondances sont proposées
+    matches = []
+    if prefix:
+        matches, total = dataset.label_index('CustomerID').search(prefix)
+        st.caption(f"{total:,} clients commencent par « {prefix} »"
+                   + (f", les {len(matches)} premiers sont proposés" if total > len(matches) else ""))
+    selection = selection_state['customers']
+    selected_customers = st.multiselect("Sélectionner des clients (aucun : tous les clients)",
+                                        options=list(dict.fromkeys(selection + matches)), default=selection)
+    selection_state['customers'] = selected_customers
+    
+    table_filters = dict(filters, CustomerID=selected_customers or None)
+    graph.input('customers', selected_customers)
+    rows = customer_product_keys
+    if selected_customers:
+        rows = graph.node('Sélection de clients', ['Agrégat client × produit', 'customers'], lambda: cached_result(
+            dataset, 'customer_product_keys', table_filters,
+            lambda: analytics.select_customers(dataset.star, customer_product_keys, selected_customers)
+        ))
+    if not rows.empty:
+        col1, col2, col3 = st.columns(3)
+        sort_label = col1.selectbox("Trier par", list(SORT_COLUMNS))
+        ascending = col2.radio("Ordre", ["Décroissant", "Croissant"], horizontal=True) == "Croissant"
+        page_size = col3.selectbox("Lignes par page", PAGE_SIZES)
+        pages = max(1, -(-len(rows) // page_size))
+        page = int(st.number_input(f"Page (sur {pages:,})", min_value=1, max_value=pages, value=1))
+        graph.input('sort', (sort_label, ascending))
+        graph.input('page', (page, page_size))
+        order = graph.node('Tri', ['Agrégat client × produit', 'customers', 'sort'], lambda: cached_result(
+            dataset, f'customer_product_order_{sort_label}_{ascending}', table_filters,
+            lambda: sort_order(rows, dataset, SORT_COLUMNS[sort_label], ascending)
+        ))
+        visible, fig_table = graph.node('Page affichée', ['Tri', 'page'],
+                                        lambda: customer_page(rows, order, page, page_size, dataset.star))
+        first = (page - 1) * page_size
+        st.caption(f"Lignes {first + 1:,} à {first + len(visible):,} sur {len(rows):,}")
+        show_chart(fig_table)
         
-        if st.button("Exporter en CSV"):
-            csv = filtered_table_data.to_csv(index=False)
-            b64 = base64.b64encode(csv.encode()).decode()
-            href = f'<a href="data:file/csv;base64,{b64}" download="rapport_ventes.csv">Télécharger le fichier CSV</a>'
-            st.markdown(href, unsafe_allow_html=True)
+        st.write("### Export")
+        col1, col2 = st.columns(2)
+        sources = ["Agrégat client × produit"]
+        if not dataset.star.empty:
+            sources.append("Lignes de ventes filtrées")
+        export_source = col1.radio("Données à exporter", sources)
+        export_format = col2.selectbox("Format", list(EXPORT_FORMATS))
+        prepared = False
+        if st.button("Préparer l'export"):
+            try:
+                if export_source == "Agrégat client × produit":
+                    chunks = iter_labeled_chunks(dataset.star, rows, order)
+                else:
+                    # Lignes de faits sous les filtres, libellées bloc par bloc
+                    fact_rows = dataset.star.filter_rows(**table_filters)
+                    chunks = iter_labeled_chunks(dataset.star, dataset.star.fact, fact_rows)
+                st.session_state.export = export_file(chunks, export_format, "rapport_ventes")
+                prepared = True
+            except Exception as e:
+                st.error(f"Erreur lors de l'export : {e}")
+        export = st.session_state.get('export')
+        if export is not None and os.path.exists(export['path']):
+            st.caption(f"{export['file_name']} : {export['rows']:,} lignes, {format_bytes(export['size_bytes'])}, "
+                       f"préparé en {export['seconds']:.1f} s")
+            if st.get_option('server.enableStaticServing') and export['size_bytes'] <= EXPORT_MAX_SERVED_BYTES:
+                # Fichier servi par Streamlit depuis le disque, par blocs : il n'est jamais chargé en mémoire
+                st.markdown(f'<a href="{export_url(export)}" download="{export["file_name"]}">'
+                            f'Télécharger {export["file_name"]}</a>', unsafe_allow_html=True)
+            elif prepared:
+                # Service statique désactivé ou fichier trop volumineux : le bouton de téléchargement garde le fichier
+                # en mémoire, il n'est donc proposé qu'à l'exécution qui l'a préparé
+                with open(export['path'], 'rb') as f:
+                    st.download_button("Télécharger", f, file_name=export['file_name'], mime=export['mime'])
+            else:
+                st.caption("Préparez l'export à nouveau pour le télécharger.")
     else:
         st.warning("Aucune donnée disponible pour les clients sélectionnés.")
     
@@ -505,21 +1068,38 @@ def page_interactive_report():
         st.session_state.page = 'home'
     st.markdown('</div>', unsafe_allow_html=True)
 
+# Fonction pour obtenir les 10 meilleurs produits du tableau de bord : (tableau, borne du mode approché) ;
+# tableau None si le détail produit a été abandonné lors d'une agrégation en flux
+def dashboard_top_products(dataset, filters, approx_mode):
+    if approx_mode:
+        return cached_result(dataset, 'approx_top_products', filters,
+                             lambda: analytics.top_products(dataset, 10, approx=True, **filters))
+    try:
+        product_sales = cached_result(dataset, 'product_sales', filters,
+                                      lambda: analytics.product_sales(dataset.cube, **filters))
+    except CuboidUnavailableError:
+        return None, None
+    return product_sales.head(10), None
+
 def page_dashboard():
     st.markdown('<div class="main-header"><h1>Dashboard</h1></div>', unsafe_allow_html=True)
     
-    if 'data' not in st.session_state or st.session_state.data is None:
+    dataset = get_active_dataset()
+    if dataset is None:
         st.error("Aucune donnée disponible. Veuillez importer un fichier de données valide dans 'Browse Files'.")
         if st.button("Retour à l'accueil"):
             st.session_state.page = 'home'
         return
     
-    df = st.session_state.data
+    cube = dataset.cube
+    catalog = dataset.catalog
     st.sidebar.header("Filtres")
-    countries = sorted(df['Country'].unique())
+    countries = catalog.values('Country')
     selected_countries = st.sidebar.multiselect("Sélectionner des pays", options=countries, default=countries)
-    months = sorted(df['Month'].unique(), key=lambda x: df[df['Month']==x]['MonthOrder'].iloc[0])
+    months = catalog.values('Month')
     selected_months = st.sidebar.multiselect("Sélectionner des mois", options=months, default=months)
+    approx_mode = st.sidebar.toggle("Mode approché (esquisses)", key='approx_mode',
+                                    help="Clients distincts par HyperLogLog et meilleurs produits par résumé de Misra-Gries")
     
     if not selected_countries or not selected_months:
         st.warning("Veuillez sélectionner au moins un pays et un mois.")
@@ -527,94 +1107,187 @@ def page_dashboard():
             st.session_state.page = 'home'
         return
     
-    filtered_df = df[df['Country'].isin(selected_countries) & df['Month'].isin(selected_months)]
-    if filtered_df.empty:
+    filters = {'Country': selected_countries, 'Month': selected_months}
+    # Graphe des panneaux : jeu actif et filtres → agrégats → graphiques ; seul l'aval d'une entrée modifiée est recalculé
+    graph = PanelGraph(get_result_cache(), 'dashboard')
+    graph.input('dataset', dataset.key)
+    graph.input('filters', filters)
+    graph.input('approx', approx_mode)
+    metrics = graph.node('Indicateurs', ['dataset', 'filters'],
+                         lambda: cached_result(dataset, 'sales_metrics', filters, lambda: analytics.sales_metrics(cube, **filters)))
+    if metrics['transactions'] == 0:
         st.warning("Aucune donnée correspond aux filtres sélectionnés.")
         if st.button("Retour à l'accueil"):
             st.session_state.page = 'home'
         return
     
-    sales_by_month_country = filtered_df.groupby(['Country', 'Month', 'MonthOrder'])['MontantVentes'].sum().reset_index().sort_values('MonthOrder')
+    sales_by_month_country = graph.node('Ventes pays × mois', ['dataset', 'filters'], lambda: cached_result(
+        dataset, 'sales_by_month_country', filters,
+        lambda: analytics.sales_by_month_country(cube, **filters)
+    ))
+    
+    # Pays au-delà des MAX_SERIES premiers : regroupés dans « Autres », sauf ceux détaillés à la demande
+    country_ranking = graph.node('Classement des pays', ['Ventes pays × mois'],
+                                 lambda: rank_values(sales_by_month_country, 'Country'))
+    drill = []
+    if len(country_ranking) > MAX_SERIES:
+        drill = st.sidebar.multiselect("Détailler des pays regroupés dans « Autres »", options=country_ranking[MAX_SERIES:])
+    graph.input('drill', drill)
+    chart_filters = dict(filters, Drill=drill or None)
     
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.subheader("Statistiques Globales")
     metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
-    total_sales = filtered_df['MontantVentes'].sum()
-    total_quantity = filtered_df['QuantiteVendue'].sum()
-    avg_sale_per_transaction = total_sales / len(filtered_df) if len(filtered_df) > 0 else 0
-    num_customers = filtered_df['CustomerID'].nunique()
-    
-    metric_col1.metric("Ventes Totales", f"{total_sales:,.2f} €")
-    metric_col2.metric("Quantité Totale Vendue", f"{total_quantity:,}")
-    metric_col3.metric("Moyenne par Transaction", f"{avg_sale_per_transaction:.2f} €")
-    metric_col4.metric("Nombre de Clients", f"{num_customers}")
+    # Estimation HyperLogLog en mode approché, ou si le détail client a été abandonné lors d'une agrégation en flux
+    num_customers, error = graph.node('Clients distincts', ['dataset', 'filters', 'approx'], lambda: cached_result(
+        dataset, 'approx_customers' if approx_mode else 'num_customers', filters,
+        lambda: analytics.distinct_customers(dataset, approx_mode, **filters)
+    ))
+    customers_help = None
+    if error is None:
+        num_customers = f"{num_customers}"
+    else:
+        num_customers = f"≈ {num_customers:,}"
+        customers_help = f"Estimation HyperLogLog : erreur type ± {error:.1%}, ± {2 * error:.1%} à 95 %"
+    
+    metric_col1.metric("Ventes Totales", f"{metrics['total_sales']:,.2f} €")
+    metric_col2.metric("Quantité Totale Vendue", f"{metrics['total_quantity']:,}")
+    metric_col3.metric("Moyenne par Transaction", f"{metrics['average_sale']:.2f} €")
+    metric_col4.metric("Nombre de Clients", num_customers, help=customers_help)
     st.markdown('</div>', unsafe_allow_html=True)
     
-    tab1, tab2, tab3, tab4 = st.tabs(["Ventes par Pays", "Ventes Mensuelles", "Ventes par Produit", "Répartition par Pays"])
+    # Seule la vue ouverte est construite (les onglets st.tabs exécuteraient les quatre à chaque interaction)
+    view = st.radio("Vue", DASHBOARD_VIEWS, horizontal=True, key='dashboard_view', label_visibility='collapsed')
+    st.markdown('<div class="card">', unsafe_allow_html=True)
     
-    with tab1:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
+    if view == "Ventes par Pays":
         st.header("Ventes totales par pays et par mois")
-        fig1 = px.bar(sales_by_month_country, x='Month', y='MontantVentes', color='Country', barmode='group',
-                     labels={'MontantVentes': 'Ventes Totales', 'Month': 'Mois', 'Country': 'Pays'},
-                     category_orders={"Month": months})
-        fig1.update_layout(xaxis_title="Mois", yaxis_title="Ventes Totales", legend_title="Pays", height=600)
-        st.plotly_chart(fig1, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        fig1 = graph.node('Graphique pays × mois', ['Ventes pays × mois', 'drill'], lambda: cached_figure(
+            dataset, 'fig_country_month', chart_filters,
+            lambda max_series: country_month_figure(sales_by_month_country, months, max_series, drill)
+        ))
+        show_chart(fig1)
     
-    with tab2:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
+    elif view == "Ventes Mensuelles":
         st.header("Ventes totales par mois pour chaque pays")
-        fig2 = go.Figure()
-        for country in sales_by_month_country['Country'].unique():
-            country_data = sales_by_month_country[sales_by_month_country['Country'] == country]
-            fig2.add_trace(go.Bar(x=country_data['Month'], y=country_data['MontantVentes'], name=country))
-        fig2.update_layout(barmode='stack', xaxis_title='Mois', yaxis_title='Ventes Totales',
-                          xaxis={'categoryorder':'array', 'categoryarray': months}, height=600)
-        st.plotly_chart(fig2, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        fig2 = graph.node('Graphique mensuel', ['Ventes pays × mois', 'drill'], lambda: cached_figure(
+            dataset, 'fig_monthly_stack', chart_filters,
+            lambda max_series: monthly_stack_figure(sales_by_month_country, months, max_series, drill)
+        ))
+        show_chart(fig2)
     
-    with tab3:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
+    elif view == "Ventes par Produit":
         st.header("Ventes totales par produit")
-        product_sales = filtered_df.groupby('ProductName')['MontantVentes'].sum().sort_values(ascending=False).reset_index()
-        top_products = product_sales.head(10)
-        fig3 = px.bar(top_products, x='ProductName', y='MontantVentes',
-                     labels={'MontantVentes': 'Ventes Totales', 'ProductName': 'Produit'},
-                     color='MontantVentes', color_continuous_scale='Viridis')
-        fig3.update_layout(xaxis_title='Produit', yaxis_title='Ventes Totales', height=600)
-        st.plotly_chart(fig3, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        top_products, bound = graph.node('Meilleurs produits', ['dataset', 'filters', 'approx'],
+                                         lambda: dashboard_top_products(dataset, filters, approx_mode))
+        if approx_mode:
+            st.caption(f"Meilleurs produits estimés par un résumé de Misra-Gries ({dataset.approx.k} produits par pays × mois) : "
+                       f"chaque montant est sous-estimé d'au plus {bound:,.2f} €.")
+        if top_products is None:
+            st.info("Le détail produit par pays et par mois n'est pas disponible pour ce jeu agrégé en flux : "
+                    "sélectionnez tous les pays et tous les mois, ou activez le mode approché.")
+        else:
+            fig3 = graph.node('Graphique produits', ['Meilleurs produits'], lambda: cached_figure(
+                dataset, 'fig_top_products_approx' if approx_mode else 'fig_top_products', filters,
+                lambda max_series: top_products_figure(top_products)
+            ))
+            show_chart(fig3)
     
-    with tab4:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
+    else:
         st.header("Répartition des ventes mensuelles par pays")
-        country_totals = sales_by_month_country.groupby('Country')['MontantVentes'].sum().to_dict()
-        col1, col2 = st.columns(2)
-        countries_list = sorted(sales_by_month_country['Country'].unique())
-        half = len(countries_list) // 2 + len(countries_list) % 2
-        
-        for i, country in enumerate(countries_list):
-            current_col = col1 if i < half else col2
-            country_data = sales_by_month_country[sales_by_month_country['Country'] == country]
-            if country_data.empty or country not in country_totals:
-                continue
-            country_data['Percentage'] = country_data['MontantVentes'] / country_totals[country] * 100
-            country_data['Labels'] = country_data.apply(
-                lambda row: f"{row['Month']} ({row['Percentage']:.1f}%)", axis=1
-            )
-            fig = go.Figure(data=[go.Pie(
-                labels=country_data['Labels'],
-                values=country_data['MontantVentes'],
-                hole=0.3,
-                sort=False
-            )])
-            fig.update_layout(title=f"Ventes pour {country}", height=400)
-            current_col.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        pies = graph.node('Camemberts par pays', ['Ventes pays × mois', 'drill'], lambda: cached_figure(
+            dataset, 'fig_country_pies', chart_filters,
+            lambda max_series: country_pies_figure(sales_by_month_country, max_series, drill)
+        ))
+        show_chart(pies)
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    if st.button("Retour à l'accueil"):
+        st.session_state.page = 'home'
+
+def page_admin():
+    st.markdown('<div class="main-header"><h1>Administration</h1></div>', unsafe_allow_html=True)
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+    
+    registry = get_registry()
+    st.subheader("Jeux de données en mémoire")
+    resident = registry.resident()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Mémoire utilisée", format_bytes(registry.total_bytes))
+    col2.metric("Plafond", format_bytes(registry.max_bytes))
+    col3.metric("Jeux résidents", f"{len(resident)}")
+    
+    if resident:
+        for entry in resident:
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.write(f"🧮 {entry['name']} ({entry['key'][:12]}) — {entry['rows']:,} lignes, "
+                         f"{format_bytes(entry['size_bytes'])}, {entry['hits']} accès, "
+                         f"dernier accès à {entry['last_used']}")
+            with col2:
+                if st.button("Décharger", key=f"evict_{entry['key']}"):
+                    registry.evict(entry['key'])
+                    st.rerun()
+    else:
+        st.info("Aucun jeu de données n'est chargé en mémoire.")
+    
+    st.subheader("Démarrage")
+    startup = get_startup()
+    # Restauration du démarrage affichée seulement si la session utilise toujours ce jeu
+    if startup['active'] is not None and startup['active'][0] == st.session_state.get('dataset_key'):
+        warm = get_registry().get(startup['active'][0])
+        if warm is not None and warm.load_report is not None:
+            st.caption(f"Jeu actif {startup['active'][1]} restauré depuis le {warm.load_report['source']} "
+                       f"en {warm.load_report['seconds'] * 1000:,.0f} ms")
+    if startup['first_pages']:
+        st.dataframe(pd.DataFrame([
+            {'Page': page, 'Premier affichage (ms)': round(first['render'] * 1000, 1),
+             'Depuis le démarrage (s)': round(first['since_start'], 1)}
+            for page, first in startup['first_pages'].items()
+        ]), hide_index=True)
+    
+    st.subheader("Cache des résultats")
+    stats = get_result_cache().stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Résultats en cache", f"{stats['entries']}")
+    col2.metric("Taille", f"{format_bytes(stats['size_bytes'])} / {format_bytes(stats['max_bytes'])}")
+    col3.metric("Succès / échecs", f"{stats['hits']} / {stats['misses']}")
+    col4.metric("Taux de succès", f"{stats['hit_rate']:.0%}")
+    st.caption(f"{stats['evictions']} résultats évincés")
+    
+    st.subheader("API de requêtes")
+    service = get_query_service()
+    if service.url is not None:
+        st.write(f"Agrégats du jeu actif servis sur {service.url} (JSON ou Arrow, ETag pour les requêtes conditionnelles)")
+        st.code(f"curl '{service.url}/query?measures=MontantVentes&by=Country,Month&Month=Jan&format=json'")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Requêtes", f"{service.stats['requests']}")
+        col2.metric("Non modifiées (304)", f"{service.stats['not_modified']}")
+        col3.metric("Servies du cache / calculées", f"{service.stats['cached']} / {service.stats['computed']}")
+        col4.metric("Erreurs", f"{service.stats['errors']}")
+    elif service.error is not None:
+        st.warning(f"Le service de requêtes n'a pas pu démarrer : {service.error}")
+    else:
+        st.info("Service de requêtes désactivé (VENTES_QUERY_API=0).")
+    
+    st.subheader("Agrégation parallèle")
+    labels = {'parallel': 'Parallèle', 'serial': 'Série'}
+    mode = st.radio("Mode d'exécution des agrégations", list(labels), format_func=labels.get,
+                    index=list(labels).index(aggregation.get_mode()), horizontal=True)
+    if mode != aggregation.get_mode():
+        aggregation.set_mode(mode)
+    st.caption(f"{aggregation.AGGREGATION_WORKERS} threads, partitions par pays au-delà de "
+               f"{aggregation.PARALLEL_MIN_ROWS:,} lignes")
+    dataset = get_active_dataset()
+    if dataset is not None and not dataset.star.empty:
+        if st.button("Mesurer l'accélération sur le jeu actif"):
+            st.session_state.speedup_report = aggregation.compare_modes(aggregation_workloads(dataset.star))
+        if 'speedup_report' in st.session_state:
+            st.dataframe(st.session_state.speedup_report, hide_index=True)
     
     if st.button("Retour à l'accueil"):
         st.session_state.page = 'home'
+    st.markdown('</div>', unsafe_allow_html=True)
 
 # Navigation
 page_map = {
@@ -625,22 +1298,42 @@ page_map = {
     'documentation': page_documentation,
     'analysis_report': page_analysis_report,
     'interactive_report': page_interactive_report,
-    'dashboard': page_dashboard
+    'dashboard': page_dashboard,
+    'admin': page_admin
 }
 
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
 
-if st.session_state.page in page_map:
-    page_map[st.session_state.page]()
-else:
-    st.error(f"Page '{st.session_state.page}' non trouvée. Retour à l'accueil.")
-    st.session_state.page = 'home'
-    page_home()
+# Nouvelle session : le jeu actif du stock est repris sans nouvel import (chargé à la première page qui l'utilise)
+if 'dataset_key' not in st.session_state:
+    restore_active_dataset()
+
+st.sidebar.toggle("Diagnostic des performances", key='profiling', value=PROFILE_DEFAULT,
+                  help="Mesure la durée et la mémoire de chaque étape de la page et les ajoute au journal")
 
-# Ajouter un pied de page
-st.markdown("""
+current_page = st.session_state.page
+try:
+    poll_ingest_job()
+    
+    with stage(f"Page {st.session_state.page}"):
+        if st.session_state.page in page_map:
+            page_map[st.session_state.page]()
+        else:
+            st.error(f"Page '{st.session_state.page}' non trouvée. Retour à l'accueil.")
+            st.session_state.page = 'home'
+            page_home()
+    
+    # Ajouter un pied de page
+    st.markdown("""
 <div class="footer">
     Système d'Analyse des Ventes © 2025
 </div>
 """, unsafe_allow_html=True)
+finally:
+    # Aussi en cas d'erreur ou de st.rerun : l'exécution est terminée et journalisée
+    profile_run = finish_run()
+
+record_first_page(current_page, time.perf_counter() - run_started)
+if profile_run is not None:
+    show_profile_panel(profile_run)
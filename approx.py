@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from sketches import HLL_PRECISION, hash_values, hll_error, hll_estimate, hll_ranks
+from star_schema import KEY_COLUMNS
+
+# Nombre de produits conservés par cellule pays × mois dans le résumé des meilleures ventes
+HEAVY_HITTERS_K = 64
+CELL_KEYS = [KEY_COLUMNS['Country'], KEY_COLUMNS['Month']]
+CUSTOMER_KEY = KEY_COLUMNS['CustomerID']
+PRODUCT_KEY = KEY_COLUMNS['ProductName']
+
+
+# Fonction pour réduire un résumé de Misra-Gries pondéré à k produits par cellule : la (k+1)-ième valeur
+# est retranchée partout et s'ajoute à la borne d'erreur de la cellule
+def compact_heavy_hitters(products, errors, k):
+    rank = products.groupby('cell')['weight'].rank(method='first', ascending=False)
+    cuts = products.loc[rank == k + 1].set_index('cell')['weight']
+    if cuts.empty:
+        return products, errors
+    products = products.assign(weight=products['weight'] - products['cell'].map(cuts).fillna(0))
+    errors = errors.copy()
+    errors[cuts.index.to_numpy()] += cuts.to_numpy()
+    return products[products['weight'] > 0].reset_index(drop=True), errors
+
+
+class ApproxSketches:
+    # Esquisses fusionnables par cellule pays × mois : HyperLogLog des clients et résumé de Misra-Gries
+    # des produits (montant des ventes) ; un filtre pays/mois fusionne les esquisses des cellules retenues
+    def __init__(self, cells=None, registers=None, products=None, errors=None, precision=HLL_PRECISION, k=HEAVY_HITTERS_K):
+        self.precision = precision
+        self.k = k
+        self.cells = cells if cells is not None else pd.DataFrame({key: pd.Series([], dtype='int64') for key in CELL_KEYS})
+        self.registers = registers if registers is not None else np.zeros((0, 1 << precision), dtype=np.uint8)
+        self.products = products if products is not None else pd.DataFrame({
+            'cell': pd.Series([], dtype='int64'),
+            PRODUCT_KEY: pd.Series([], dtype='int64'),
+            'weight': pd.Series([], dtype='float64'),
+        })
+        self.errors = errors if errors is not None else np.zeros(0)
+
+    # Numéros de cellule des lignes d'un agrégat ; les cellules inconnues sont ajoutées
+    def _cell_ids(self, cells, table):
+        pairs = pd.MultiIndex.from_frame(table[CELL_KEYS].astype('int64'))
+        ids = pd.MultiIndex.from_frame(cells).get_indexer(pairs)
+        if (ids < 0).any():
+            new = table.loc[ids < 0, CELL_KEYS].astype('int64').drop_duplicates()
+            cells = pd.concat([cells, new], ignore_index=True)
+            ids = pd.MultiIndex.from_frame(cells).get_indexer(pairs)
+        return cells, ids
+
+    # Nouvelle version après intégration d'agrégats pays × mois × client et pays × mois × produit
+    # (cuboïdes complets à l'import, deltas d'un lot ou d'un bloc ensuite)
+    def update(self, customers, products):
+        customers = customers[(customers[CELL_KEYS + [CUSTOMER_KEY]] >= 0).all(axis=1)]
+        products = products[(products[CELL_KEYS + [PRODUCT_KEY]] >= 0).all(axis=1)]
+        cells, customer_cells = self._cell_ids(self.cells, customers)
+        cells, product_cells = self._cell_ids(cells, products)
+
+        registers = np.zeros((len(cells), self.registers.shape[1]), dtype=np.uint8)
+        registers[:len(self.registers)] = self.registers
+        index, rank = hll_ranks(hash_values(customers[CUSTOMER_KEY].to_numpy(dtype=np.int64)), self.precision)
+        np.maximum.at(registers, (customer_cells, index), rank)
+
+        errors = np.zeros(len(cells))
+        errors[:len(self.errors)] = self.errors
+        # Montants négatifs (retours) ignorés : le résumé classe les ventes brutes
+        delta = pd.DataFrame({
+            'cell': product_cells.astype(np.int64),
+            PRODUCT_KEY: products[PRODUCT_KEY].to_numpy(dtype=np.int64),
+            'weight': products['MontantVentes'].clip(lower=0).to_numpy(dtype=np.float64),
+        })
+        merged = pd.concat([self.products, delta], ignore_index=True)
+        merged = merged.groupby(['cell', PRODUCT_KEY], sort=False)['weight'].sum().reset_index()
+        merged, errors = compact_heavy_hitters(merged, errors, self.k)
+        return ApproxSketches(cells, registers, merged, errors, self.precision, self.k)
+
+    # Cellules retenues par les filtres (libellés) pays et mois
+    def _select(self, star, filters):
+        mask = np.ones(len(self.cells), dtype=bool)
+        for dim in ('Country', 'Month'):
+            labels = filters.get(dim)
+            if labels is not None:
+                mask &= self.cells[KEY_COLUMNS[dim]].isin(star.keys_for(dim, labels)).to_numpy()
+        return np.flatnonzero(mask)
+
+    # Nombre approché de clients distincts et erreur relative type
+    def distinct_customers(self, star, **filters):
+        cells = self._select(star, filters)
+        error = hll_error(self.registers.shape[1])
+        if len(cells) == 0:
+            return 0, error
+        return hll_estimate(self.registers[cells].max(axis=0)), error
+
+    # Meilleurs produits approchés et borne de sous-estimation de chaque montant
+    def top_products(self, star, n=10, **filters):
+        cells = self._select(star, filters)
+        selected = self.products[self.products['cell'].isin(cells)]
+        top = selected.groupby(PRODUCT_KEY)['weight'].sum().nlargest(n)
+        table = pd.DataFrame({PRODUCT_KEY: top.index.to_numpy(), 'MontantVentes': top.to_numpy()})
+        return star.label(table), float(self.errors[cells].sum())
+
+    def memory_usage(self):
+        return int(self.registers.nbytes + self.errors.nbytes + self.products.memory_usage(deep=True).sum()
+                   + self.cells.memory_usage(deep=True).sum())
+
+
+# Fonction pour construire les esquisses d'un cube à partir de ses cuboïdes détaillés
+def build_approx(cube):
+    return ApproxSketches().update(cube.cuboids[('Country', 'Month', 'CustomerID')],
+                                   cube.cuboids[('Country', 'Month', 'ProductName')])
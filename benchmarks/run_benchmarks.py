@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import analytics
+from customer_report import sort_order
+from ingest import MONTHS, read_sales_file
+from registry import build_dataset
+
+from benchmarks.synthetic import write_synthetic
+
+# Fichier de référence par défaut, à côté de ce script
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# Écart relatif toléré sur les résultats numériques (sommes en virgule flottante)
+RESULT_TOLERANCE = 1e-6
+
+
+# Fonction pour résumer un résultat en empreinte comparable : nombre de lignes et sommes des colonnes numériques
+def result_digest(value):
+    if isinstance(value, pd.DataFrame):
+        numeric = value.select_dtypes('number')
+        return {'rows': len(value), **{col: float(numeric[col].sum()) for col in numeric.columns}}
+    if isinstance(value, dict):
+        return {key: float(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [result_digest(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return {'rows': len(value), 'sum': float(value.sum())}
+    if value is None:
+        return None
+    return float(value)
+
+
+# Fonction pour comparer deux empreintes de résultat, avec la tolérance des sommes en virgule flottante
+def same_result(current, reference):
+    if isinstance(reference, dict):
+        return (isinstance(current, dict) and current.keys() == reference.keys()
+                and all(same_result(current[key], reference[key]) for key in reference))
+    if isinstance(reference, list):
+        return (isinstance(current, list) and len(current) == len(reference)
+                and all(same_result(a, b) for a, b in zip(current, reference)))
+    if reference is None or current is None:
+        return current is reference
+    return bool(np.isclose(current, reference, rtol=RESULT_TOLERANCE, atol=RESULT_TOLERANCE))
+
+
+# Fonction pour mesurer une étape : meilleur temps sur `repeat` exécutions, puis pic de mémoire Python (tracemalloc)
+# sur une exécution de plus, séparée pour ne pas fausser les temps
+def measure(fn, repeat, memory=True):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, min(times), peak
+
+
+# Fonction pour lister les étapes mesurées sur un jeu de données : filtres et agrégations de chaque page
+def page_workloads(dataset):
+    cube, star = dataset.cube, dataset.star
+    countries = dataset.catalog.values('Country')
+    # Filtres typiques : la moitié des pays, un semestre ; sélection des clients des 20 plus grosses lignes
+    filters = {'Country': countries[:max(1, len(countries) // 2)], 'Month': MONTHS[:6]}
+    keys = analytics.customer_product_keys(cube, **filters)
+    selected = keys.nlargest(20, 'QuantiteVendue')
+    customer_labels = star.label(selected)['CustomerID'].astype(str).unique().tolist()
+    return {
+        'Filtre de la table de faits': lambda: star.filter_rows(**filters),
+        'Tableau de bord : indicateurs': lambda: analytics.sales_metrics(cube, **filters),
+        'Tableau de bord : clients distincts': lambda: analytics.distinct_customers(dataset, **filters),
+        'Tableau de bord : clients distincts (approché)': lambda: analytics.distinct_customers(dataset, True, **filters),
+        'Tableau de bord : pays × mois': lambda: analytics.sales_by_month_country(cube, **filters),
+        'Tableau de bord : produits': lambda: analytics.product_sales(cube, **filters),
+        'Tableau de bord : produits (approché)': lambda: analytics.top_products(dataset, 10, True, **filters),
+        "Rapport d'analyse : pays": lambda: analytics.top_countries(cube),
+        "Rapport d'analyse : mois": lambda: analytics.monthly_sales(cube),
+        'Rapport interactif : client × produit': lambda: analytics.customer_product_keys(cube, **filters),
+        'Rapport interactif : sélection de clients': lambda: analytics.select_customers(star, keys, customer_labels),
+        'Rapport interactif : tri par quantité': lambda: sort_order(keys, dataset, 'QuantiteVendue', False),
+        'Rapport interactif : tri par client': lambda: sort_order(keys, dataset, 'CustomerID', True),
+    }
+
+
+# Fonction pour exécuter toutes les mesures sur un jeu synthétique ; renvoie {étape: mesures}
+def run_suite(rows, params, workdir, fmt='csv', repeat=3, memory=True):
+    path = os.path.join(workdir, f"ventes_{rows}_{params['seed']}.{fmt}")
+    results = {}
+    start = time.perf_counter()
+    write_synthetic(path, rows, **params)
+    print(f"{rows:,} lignes générées en {time.perf_counter() - start:.1f} s ({path})", file=sys.stderr)
+
+    # Lecture et construction : une seule exécution chronométrée (coûteuses sur les gros volumes)
+    (df, report), seconds, peak = measure(lambda: read_sales_file(path, os.path.basename(path)), 1, memory)
+    results['Lecture du fichier'] = {'seconds': seconds, 'peak_bytes': peak, 'result': {'rows': report['rows']}}
+    dataset, seconds, peak = measure(lambda: build_dataset(df, path, profile=report['profile']), 1, memory)
+    results['Schéma en étoile et cube'] = {'seconds': seconds, 'peak_bytes': peak, 'result': {'rows': dataset.rows}}
+    del df
+
+    for name, fn in page_workloads(dataset).items():
+        result, seconds, peak = measure(fn, repeat, memory)
+        results[name] = {'seconds': seconds, 'peak_bytes': peak, 'result': result_digest(result)}
+    os.remove(path)
+    return results
+
+
+# Fonction pour comparer des mesures à la référence : ratio des temps, régression au-delà de la tolérance,
+# résultats différents
+def compare(results, reference, tolerance):
+    rows = []
+    for name, current in results.items():
+        base = reference.get(name) if reference else None
+        ratio = current['seconds'] / base['seconds'] if base and base['seconds'] else None
+        status = 'nouveau'
+        if base is not None:
+            if not same_result(current['result'], base['result']):
+                status = 'résultat différent'
+            elif ratio is not None and ratio > 1 + tolerance:
+                status = 'régression'
+            elif ratio is not None and ratio < 1 - tolerance:
+                status = 'amélioration'
+            else:
+                status = 'stable'
+        rows.append({
+            'Étape': name,
+            'Temps (ms)': round(current['seconds'] * 1000, 2),
+            'Référence (ms)': round(base['seconds'] * 1000, 2) if base else None,
+            'Ratio': round(ratio, 2) if ratio is not None else None,
+            'Pic mémoire (Mo)': round(current['peak_bytes'] / 2**20, 1) if current['peak_bytes'] is not None else None,
+            'Statut': status,
+        })
+    return pd.DataFrame(rows)
+
+
+def config_key(rows, params, fmt):
+    return (f"rows={rows};countries={params['countries']};customers={params['customers']};"
+            f"products={params['products']};seed={params['seed']};format={fmt}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesures de performance sur des ventes synthétiques")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000],
+                        help="Nombres de lignes générées (ex. 100000 1000000 100000000)")
+    parser.add_argument('--countries', type=int, default=20)
+    parser.add_argument('--customers', type=int, default=5_000)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--repeat', type=int, default=3, help="Exécutions par étape (le meilleur temps est retenu)")
+    parser.add_argument('--no-memory', action='store_true', help="Ne pas mesurer le pic de mémoire")
+    parser.add_argument('--workdir', default=tempfile.gettempdir())
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="Enregistrer les mesures comme nouvelle référence")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Ralentissement toléré (0.25 : +25 %%)")
+    args = parser.parse_args(argv)
+
+    params = {'countries': args.countries, 'customers': args.customers, 'products': args.products, 'seed': args.seed}
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    failed = False
+    for rows in args.rows:
+        key = config_key(rows, params, args.format)
+        results = run_suite(rows, params, args.workdir, args.format, args.repeat, not args.no_memory)
+        report = compare(results, baseline.get(key), args.tolerance)
+        print(f"\n{key}")
+        print(report.to_string(index=False))
+        failed |= report['Statut'].isin(['régression', 'résultat différent']).any()
+        if args.save_baseline:
+            baseline[key] = results
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"\nRéférence enregistrée dans {args.baseline}")
+    return 1 if failed and not args.save_baseline else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
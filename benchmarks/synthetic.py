@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingest import MONTHS
+
+# Nombre de lignes générées à la fois : l'écriture de 100 M de lignes ne tient jamais tout en mémoire
+GENERATOR_CHUNK_ROWS = 1_000_000
+
+
+# Fonction pour générer des ventes synthétiques bloc par bloc ; un même germe donne toujours les mêmes lignes.
+# Les pays, clients et produits suivent une loi de Zipf (quelques gros contributeurs, une longue traîne),
+# le montant est le prix du produit multiplié par la quantité.
+def synthetic_chunks(rows, countries=20, customers=5_000, products=500, seed=0, chunk_rows=GENERATOR_CHUNK_ROWS):
+    rng = np.random.default_rng(seed)
+    country_names = np.array([f"Pays {i:03d}" for i in range(countries)], dtype=object)
+    product_names = np.array([f"Produit {i:05d}" for i in range(products)], dtype=object)
+    prices = np.round(rng.lognormal(mean=2.5, sigma=0.8, size=products), 2)
+    weights = {size: zipf_weights(size) for size in (countries, customers, products)}
+    for index, start in enumerate(range(0, rows, chunk_rows)):
+        size = min(chunk_rows, rows - start)
+        chunk_rng = np.random.default_rng([seed, index])
+        product = chunk_rng.choice(products, size, p=weights[products])
+        quantity = chunk_rng.integers(1, 20, size)
+        yield pd.DataFrame({
+            'Country': country_names[chunk_rng.choice(countries, size, p=weights[countries])],
+            'Month': np.array(MONTHS, dtype=object)[chunk_rng.integers(0, len(MONTHS), size)],
+            'CustomerID': 10_000 + chunk_rng.choice(customers, size, p=weights[customers]),
+            'ProductName': product_names[product],
+            'QuantiteVendue': quantity,
+            'MontantVentes': np.round(prices[product] * quantity, 2),
+        })
+
+
+# Fonction pour calculer des poids de Zipf (exposant 1) normalisés
+def zipf_weights(size):
+    weights = 1.0 / np.arange(1, size + 1)
+    return weights / weights.sum()
+
+
+# Fonction pour écrire un fichier de ventes synthétiques (CSV ou Parquet selon l'extension) ; renvoie le nombre de lignes
+def write_synthetic(path, rows, **params):
+    path = str(path)
+    written = 0
+    if path.endswith('.parquet'):
+        writer = None
+        try:
+            for chunk in synthetic_chunks(rows, **params):
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                written += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return written
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in synthetic_chunks(rows, **params):
+            chunk.to_csv(f, index=False, header=written == 0)
+            written += len(chunk)
+    return written
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from star_schema import KEY_COLUMNS
+
+
+class DimensionCatalog:
+    # Valeurs distinctes de chaque dimension, dans l'ordre d'affichage, avec cardinalité et nombre de lignes
+    def __init__(self, entries):
+        self.entries = entries
+        self._values = {dim: entry['label'].tolist() for dim, entry in entries.items()}
+
+    # Options des filtres et ordre des catégories des graphiques
+    def values(self, dim):
+        return self._values[dim]
+
+    def cardinality(self, dim):
+        return len(self._values[dim])
+
+    # Résumé de toutes les dimensions
+    def summary(self):
+        return pd.DataFrame({
+            'Dimension': list(self.entries),
+            'Cardinalité': [self.cardinality(dim) for dim in self.entries],
+            'Lignes': [int(entry['rows'].sum()) for entry in self.entries.values()],
+        })
+
+    # Nouvelle version après l'ajout d'un lot : seuls les comptes du lot sont ajoutés
+    def with_batch(self, star, batch):
+        counts = {dim: entry['rows'] for dim, entry in self.entries.items()}
+        return build_catalog(star, batch, counts)
+
+
+# Fonction pour compter les lignes par clé d'une dimension
+def count_keys(keys, size):
+    keys = keys[keys >= 0].astype(np.int64)
+    return np.bincount(keys, minlength=size)[:size]
+
+
+# Fonction pour construire le catalogue des dimensions en une passe sur les clés de faits
+def build_catalog(star, fact=None, previous_counts=None):
+    fact = star.fact if fact is None else fact
+    entries = {}
+    for dim, key in KEY_COLUMNS.items():
+        table = star.dims[dim]
+        counts = count_keys(fact[key].to_numpy(), len(table))
+        if previous_counts is not None:
+            previous = previous_counts[dim].reindex(table.index, fill_value=0).to_numpy()
+            counts = counts + previous
+        entry = pd.DataFrame({'label': table[dim].to_numpy(), 'rows': counts}, index=table.index)
+        if 'MonthOrder' in table.columns:
+            entry['order'] = table['MonthOrder'].to_numpy()
+            entry = entry.sort_values('order', kind='stable')
+        else:
+            entry = entry.sort_values('label', kind='stable')
+        entries[dim] = entry[entry['rows'] > 0]
+    return DimensionCatalog(entries)
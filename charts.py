@@ -0,0 +1,129 @@
+import json
+import math
+import os
+
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+# Niveau de détail : nombre maximal de séries par graphique (la traîne est regroupée dans « Autres »),
+# nombre de points au-delà duquel les courbes passent en WebGL, et taille maximale d'une figure sérialisée
+MAX_SERIES = int(os.environ.get('VENTES_CHART_MAX_SERIES', '12'))
+WEBGL_POINTS = int(os.environ.get('VENTES_CHART_WEBGL_POINTS', '1000'))
+FIGURE_BUDGET_KB = int(os.environ.get('VENTES_FIGURE_BUDGET_KB', '1024'))
+OTHERS_LABEL = 'Autres'
+
+# Nombre de colonnes de la grille des camemberts par pays et hauteur d'une ligne de la grille
+PIE_COLUMNS = 2
+PIE_ROW_HEIGHT = 400
+# Couleurs des mois, identiques d'un camembert à l'autre
+MONTH_COLORS = px.colors.qualitative.Plotly + px.colors.qualitative.D3
+
+
+# Fonction pour sérialiser une figure : c'est la forme mise en cache et transmise au navigateur
+def figure_json(fig):
+    return fig.to_json()
+
+
+# Fonction pour construire une figure dont le JSON tient dans le budget : build(max_series) est rappelée
+# avec deux fois moins de séries tant que la figure est trop grosse
+def figure_within_budget(build, max_series=MAX_SERIES, budget_kb=FIGURE_BUDGET_KB):
+    payload = figure_json(build(max_series))
+    while len(payload) > budget_kb * 1024 and max_series > 1:
+        max_series //= 2
+        payload = figure_json(build(max_series))
+    return payload
+
+
+# Fonction pour classer les valeurs d'une dimension par montant décroissant
+def rank_values(sales, dim, value='MontantVentes'):
+    totals = sales.groupby(dim, observed=True)[value].sum().sort_values(ascending=False)
+    return totals.index.astype(str).tolist()
+
+
+# Fonction pour regrouper dans « Autres » les valeurs d'une dimension hors des max_series premières
+# (et hors des valeurs détaillées à la demande) ; les autres colonnes restent des clés de regroupement
+def group_tail(sales, dim, max_series=MAX_SERIES, keep=(), value='MontantVentes'):
+    ranking = rank_values(sales, dim, value)
+    shown = set(ranking[:max_series]) | set(keep)
+    if len(shown) >= len(ranking):
+        return sales
+    labels = sales[dim].astype(str)
+    sales = sales.assign(**{dim: labels.where(labels.isin(shown), OTHERS_LABEL)})
+    keys = [col for col in sales.columns if col != value]
+    return sales.groupby(keys, observed=True, sort=False)[value].sum().reset_index()
+
+
+# Fonction pour relire une figure sérialisée sous une forme acceptée par st.plotly_chart
+def load_figure(payload):
+    return json.loads(payload)
+
+
+# Fonction pour ordonner les séries d'un graphique : « Autres » en dernier
+def series_order(sales, dim):
+    values = [value for value in sales[dim].astype(str).unique() if value != OTHERS_LABEL]
+    return values + [OTHERS_LABEL] if len(values) < sales[dim].nunique() else values
+
+
+# Fonction pour construire une courbe ; au-delà de WEBGL_POINTS points, le rendu passe en WebGL (Scattergl)
+def line_figure(data, x, y, labels, **kwargs):
+    render_mode = 'webgl' if len(data) > WEBGL_POINTS else 'svg'
+    return px.line(data, x=x, y=y, labels=labels, render_mode=render_mode, **kwargs)
+
+
+# Fonction pour construire le graphique des ventes par pays et par mois (barres groupées)
+def country_month_figure(sales, months, max_series=MAX_SERIES, keep=()):
+    sales = group_tail(sales, 'Country', max_series, keep)
+    fig = px.bar(sales, x='Month', y='MontantVentes', color='Country', barmode='group',
+                 labels={'MontantVentes': 'Ventes Totales', 'Month': 'Mois', 'Country': 'Pays'},
+                 category_orders={"Month": months, "Country": series_order(sales, 'Country')})
+    fig.update_layout(xaxis_title="Mois", yaxis_title="Ventes Totales", legend_title="Pays", height=600)
+    return fig
+
+
+# Fonction pour construire le graphique des ventes mensuelles empilées par pays
+def monthly_stack_figure(sales, months, max_series=MAX_SERIES, keep=()):
+    sales = group_tail(sales, 'Country', max_series, keep)
+    fig = go.Figure()
+    groups = dict(list(sales.groupby('Country', observed=True, sort=False)))
+    for country in series_order(sales, 'Country'):
+        country_data = groups[country]
+        fig.add_trace(go.Bar(x=country_data['Month'], y=country_data['MontantVentes'], name=country))
+    fig.update_layout(barmode='stack', xaxis_title='Mois', yaxis_title='Ventes Totales',
+                      xaxis={'categoryorder': 'array', 'categoryarray': months}, height=600)
+    return fig
+
+
+# Fonction pour construire le graphique des meilleurs produits
+def top_products_figure(top_products):
+    fig = px.bar(top_products, x='ProductName', y='MontantVentes',
+                 labels={'MontantVentes': 'Ventes Totales', 'ProductName': 'Produit'},
+                 color='MontantVentes', color_continuous_scale='Viridis')
+    fig.update_layout(xaxis_title='Produit', yaxis_title='Ventes Totales', height=600)
+    return fig
+
+
+# Fonction pour construire une seule figure en grille avec un camembert des ventes mensuelles par pays
+def country_pies_figure(sales, max_series=MAX_SERIES, keep=()):
+    sales = group_tail(sales, 'Country', max_series, keep)
+    sales = sales.assign(Country=sales['Country'].astype(str), Month=sales['Month'].astype(str))
+    sales = sales[sales['MontantVentes'] != 0]
+    # Pays par ordre alphabétique, « Autres » en dernier
+    sales = sales.assign(Last=sales['Country'] == OTHERS_LABEL).sort_values(['Last', 'Country', 'MonthOrder'])
+    # Pourcentages et libellés calculés en une fois pour tous les pays
+    percentage = sales['MontantVentes'] / sales.groupby('Country')['MontantVentes'].transform('sum') * 100
+    labels = sales['Month'] + ' (' + percentage.round(1).astype(str) + '%)'
+    colors = [MONTH_COLORS[order % len(MONTH_COLORS)] for order in sales['MonthOrder'].astype(int)]
+    sales = sales.assign(Labels=labels.to_numpy(), Color=colors)
+
+    countries = sales['Country'].unique()
+    rows = max(1, math.ceil(len(countries) / PIE_COLUMNS))
+    fig = make_subplots(rows=rows, cols=PIE_COLUMNS, specs=[[{'type': 'domain'}] * PIE_COLUMNS] * rows,
+                        subplot_titles=[f"Ventes pour {country}" for country in countries],
+                        vertical_spacing=min(0.08, 0.3 / rows))
+    for i, (country, country_data) in enumerate(sales.groupby('Country', sort=False)):
+        fig.add_trace(go.Pie(labels=country_data['Labels'], values=country_data['MontantVentes'], name=country,
+                             marker={'colors': country_data['Color']}, hole=0.3, sort=False, textinfo='label'),
+                      row=i // PIE_COLUMNS + 1, col=i % PIE_COLUMNS + 1)
+    fig.update_layout(height=PIE_ROW_HEIGHT * rows, showlegend=False)
+    return fig
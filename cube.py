@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+
+from aggregation import sum_by
+from star_schema import KEY_COLUMNS, build_filter_index, select_rows
+
+# Mesures additives conservées dans chaque cuboïde
+MEASURES = ['QuantiteVendue', 'MontantVentes', 'Transactions']
+
+# Cuboïdes matérialisés, chacun calculé à partir de son parent (le premier à partir des faits)
+CUBOIDS = [
+    (('Country', 'Month', 'CustomerID', 'ProductName'), None),
+    (('Country', 'Month', 'CustomerID'), ('Country', 'Month', 'CustomerID', 'ProductName')),
+    (('Country', 'Month', 'ProductName'), ('Country', 'Month', 'CustomerID', 'ProductName')),
+    (('Country', 'Month'), ('Country', 'Month', 'ProductName')),
+    (('Country',), ('Country', 'Month')),
+    (('Month',), ('Country', 'Month')),
+    ((), ('Country', 'Month')),
+]
+
+
+class CuboidUnavailableError(LookupError):
+    pass
+
+
+# Largeur maximale (en bits) des clés empaquetées d'un cuboïde ; au-delà, l'ajout par delta réagrège le cuboïde
+MAX_PACKED_BITS = 62
+
+
+# Fonction pour empaqueter les clés d'une table en un entier par ligne (clé -1 des valeurs manquantes comprise)
+def pack_keys(table, keys, widths):
+    codes = np.zeros(len(table), dtype=np.int64)
+    for key, width in zip(keys, widths):
+        codes = (codes << width) | (table[key].to_numpy(dtype=np.int64) + 1)
+    return codes
+
+
+class KeyIndex:
+    # Index trié des clés empaquetées d'un cuboïde : les lignes touchées par un lot sont retrouvées par recherche
+    # dichotomique et les nouvelles clés insérées, sans regrouper le cuboïde. Chaque largeur garde un bit de marge
+    # pour que l'index survive à la croissance des dimensions.
+    def __init__(self, widths, codes, rows):
+        self.widths = widths
+        self.codes = codes
+        self.rows = rows
+
+    @classmethod
+    def build(cls, table, keys, sizes):
+        widths = [size.bit_length() + 1 for size in sizes]
+        if sum(widths) > MAX_PACKED_BITS:
+            return None
+        codes = pack_keys(table, keys, widths)
+        order = np.argsort(codes)
+        return cls(widths, codes[order], order)
+
+    # Vrai si des dimensions de ces tailles tiennent encore dans les largeurs de l'index
+    def fits(self, sizes):
+        return all(size.bit_length() <= width for size, width in zip(sizes, self.widths))
+
+    # Lignes du cuboïde correspondant à des clés empaquetées (-1 pour une clé absente)
+    def lookup(self, codes):
+        positions = np.minimum(np.searchsorted(self.codes, codes), max(len(self.codes) - 1, 0))
+        if not len(self.codes):
+            return np.full(len(codes), -1, dtype=np.int64)
+        return np.where(self.codes[positions] == codes, self.rows[positions], -1)
+
+    # Nouvel index avec des clés ajoutées en fin de cuboïde (l'index courant reste valable pour l'ancienne version)
+    def extend(self, codes, rows):
+        order = np.argsort(codes)
+        positions = np.searchsorted(self.codes, codes[order])
+        return KeyIndex(self.widths, np.insert(self.codes, positions, codes[order]),
+                        np.insert(self.rows, positions, rows[order]))
+
+    def memory_usage(self):
+        return int(self.codes.nbytes + self.rows.nbytes)
+
+
+# Fonction pour ajouter à un cuboïde un delta agrégé sur les mêmes clés : sommes ajoutées aux lignes existantes,
+# nouvelles clés ajoutées à la fin ; le coût dépend du lot (hors copie des colonnes), pas de l'historique
+def merge_delta(table, delta, keys, index):
+    codes = pack_keys(delta, keys, index.widths)
+    rows = index.lookup(codes)
+    found = rows >= 0
+    columns = {}
+    # Une seule copie par colonne : anciennes lignes puis nouvelles clés, sommes du lot ajoutées en place
+    for col in table.columns:
+        values = np.concatenate([table[col].to_numpy(), delta[col].to_numpy()[~found]])
+        if col in MEASURES:
+            values[rows[found]] += delta[col].to_numpy()[found]
+        columns[col] = values
+    merged = pd.DataFrame(columns, copy=False)
+    return merged, index.extend(codes[~found], np.arange(len(table), len(merged), dtype=np.int64))
+
+
+# Fonction pour agréger une table sur des clés (ensemble vide : total général)
+def rollup(table, keys):
+    if not keys:
+        return pd.DataFrame({measure: [table[measure].sum()] for measure in MEASURES})
+    return sum_by(table, keys, MEASURES)
+
+
+class Cube:
+    def __init__(self, star, cuboids):
+        self.star = star
+        self.cuboids = cuboids
+        self._indexes = {}
+        self._key_indexes = {}
+
+    # Plus petit cuboïde contenant toutes les dimensions demandées
+    def cuboid_for(self, dims):
+        candidates = [key for key in self.cuboids if set(dims) <= set(key)]
+        if not candidates:
+            raise CuboidUnavailableError(f"Aucun cuboïde ne couvre {', '.join(sorted(dims))}")
+        return min(candidates, key=lambda key: len(self.cuboids[key]))
+
+    # Vrai si les libellés couvrent toutes les valeurs de la dimension
+    def covers_all(self, dim, labels):
+        return len(self.star.keys_for(dim, set(labels))) == len(self.star.dims[dim])
+
+    # Tranche du cuboïde adapté aux dimensions et aux filtres (libellés) demandés
+    def slice(self, dims, filters):
+        filters = {dim: labels for dim, labels in filters.items() if labels is not None}
+        try:
+            key = self.cuboid_for(set(dims) | set(filters))
+        except CuboidUnavailableError:
+            # Cube partiel (agrégation en flux) : un filtre couvrant toutes les valeurs est ignoré
+            filters = {dim: labels for dim, labels in filters.items() if not self.covers_all(dim, labels)}
+            key = self.cuboid_for(set(dims) | set(filters))
+        table = self.cuboids[key]
+        if filters:
+            rows = select_rows(table, self.filter_index(key), self.star, filters)
+            if rows is not None:
+                table = table.take(rows)
+        return key, table
+
+    # Index pays/mois d'un cuboïde, construit à sa première tranche filtrée
+    def filter_index(self, key):
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = build_filter_index(self.cuboids[key])
+        return index
+
+    # Mesures agrégées par dimensions, sur les clés (libellés non joints)
+    def query_keys(self, dims, measures=None, **filters):
+        key, table = self.slice(dims, filters)
+        keys = [KEY_COLUMNS[dim] for dim in dims]
+        if set(dims) != set(key):
+            table = rollup(table, keys)
+        if keys:
+            table = table[(table[keys] >= 0).all(axis=1)]
+        return table[keys + (measures or MEASURES)].reset_index(drop=True)
+
+    # Mesures agrégées par dimensions, avec libellés
+    def query(self, dims, measures=None, **filters):
+        return self.star.label(self.query_keys(dims, measures, **filters))
+
+    # Totaux des mesures sous les filtres
+    def totals(self, **filters):
+        _, table = self.slice((), filters)
+        return {measure: table[measure].sum() for measure in MEASURES}
+
+    # Index des clés d'un cuboïde pour l'ajout par delta, construit au premier ajout, puis reconstruit seulement
+    # quand une dimension dépasse la largeur prévue ; None si les clés ne tiennent pas dans un entier
+    def key_index(self, dims, star):
+        sizes = [len(star.dims[dim]) for dim in dims]
+        index = self._key_indexes.get(dims)
+        if index is None or not index.fits(sizes):
+            index = KeyIndex.build(self.cuboids[dims], [KEY_COLUMNS[dim] for dim in dims], sizes)
+            if index is not None:
+                self._key_indexes[dims] = index
+        return index
+
+    # Nouvelle version incrémentale : seul le lot est agrégé, puis ajouté à chaque cuboïde aux clés qu'il touche ;
+    # renvoie aussi les deltas par cuboïde (pour mettre à jour les esquisses)
+    def with_batch(self, star, batch):
+        deltas = {}
+        cuboids = {}
+        key_indexes = {}
+        for dims, parent in CUBOIDS:
+            keys = [KEY_COLUMNS[dim] for dim in dims]
+            source = batch.assign(Transactions=1) if parent is None else deltas[parent]
+            deltas[dims] = rollup(source, keys)
+            index = self.key_index(dims, star) if keys else None
+            if index is None:
+                cuboids[dims] = rollup(pd.concat([self.cuboids[dims], deltas[dims]], ignore_index=True), keys)
+            else:
+                cuboids[dims], key_indexes[dims] = merge_delta(self.cuboids[dims], deltas[dims], keys, index)
+        cube = Cube(star, cuboids)
+        cube._key_indexes = key_indexes
+        return cube, deltas
+
+    def memory_usage(self):
+        total = sum(table.memory_usage(deep=True).sum() for table in self.cuboids.values())
+        total += sum(index.memory_usage() for index in self._indexes.values())
+        total += sum(index.memory_usage() for index in self._key_indexes.values())
+        return int(total)
+
+    # Nombre de valeurs distinctes d'une dimension sous les filtres
+    def distinct(self, dim, **filters):
+        _, table = self.slice((dim,), filters)
+        keys = table[KEY_COLUMNS[dim]]
+        return keys[keys >= 0].nunique()
+
+
+# Fonction pour matérialiser le cube d'un schéma en étoile
+def build_cube(star):
+    cuboids = {}
+    for dims, parent in CUBOIDS:
+        keys = [KEY_COLUMNS[dim] for dim in dims]
+        if parent is None:
+            fact = star.fact.assign(Transactions=1)
+            cuboids[dims] = rollup(fact, keys)
+        else:
+            cuboids[dims] = rollup(cuboids[parent], keys)
+    return Cube(star, cuboids)
+
+
+# Fonction pour lister les agrégations des pages sur la table de faits, pour comparer les modes d'exécution
+def aggregation_workloads(star):
+    fact = star.fact.assign(Transactions=1)
+    return {
+        'Pays × mois': lambda: rollup(fact, [KEY_COLUMNS['Country'], KEY_COLUMNS['Month']]),
+        'Classement des produits': lambda: rollup(fact, [KEY_COLUMNS['ProductName']]),
+        'Client × produit': lambda: rollup(fact, [KEY_COLUMNS['CustomerID'], KEY_COLUMNS['ProductName']]),
+        'Cuboïde de base': lambda: rollup(fact, list(KEY_COLUMNS.values())),
+    }
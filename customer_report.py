@@ -0,0 +1,51 @@
+import numpy as np
+
+from star_schema import KEY_COLUMNS
+
+# Tailles de page et tris proposés pour le rapport client × produit
+PAGE_SIZES = [25, 50, 100]
+SORT_COLUMNS = {'Quantité': 'QuantiteVendue', 'Client': 'CustomerID', 'Produit': 'ProductName'}
+# Nombre maximal de suggestions affichées pour une recherche
+SEARCH_LIMIT = 50
+
+
+class LabelIndex:
+    # Libellés d'une dimension triés une fois : recherche par préfixe (dichotomie) et rang de chaque clé,
+    # pour trier un résultat par libellé sans comparer de chaînes
+    def __init__(self, labels):
+        labels = np.asarray(labels, dtype=object)
+        self.order = np.argsort(labels, kind='stable')
+        self.sorted = labels[self.order]
+        self.ranks = np.empty(len(labels), dtype=np.int64)
+        self.ranks[self.order] = np.arange(len(labels))
+
+    # Libellés commençant par le préfixe (au plus limit), et nombre total de correspondances
+    def search(self, prefix, limit=SEARCH_LIMIT):
+        start = np.searchsorted(self.sorted, prefix, side='left')
+        stop = np.searchsorted(self.sorted, prefix + '\U0010ffff', side='left')
+        return self.sorted[start:min(stop, start + limit)].tolist(), int(stop - start)
+
+    def memory_usage(self):
+        return int(self.order.nbytes + self.sorted.nbytes + self.ranks.nbytes)
+
+
+# Fonction pour calculer l'ordre des lignes d'un résultat sur les clés, trié par mesure ou par libellé
+def sort_order(table, dataset, column, ascending):
+    if column in KEY_COLUMNS:
+        values = dataset.label_index(column).ranks[table[KEY_COLUMNS[column]].to_numpy()]
+    else:
+        values = table[column].to_numpy()
+    order = np.argsort(values, kind='stable')
+    return order if ascending else order[::-1]
+
+
+# Fonction pour extraire une page d'un résultat trié ; seules les lignes de la page reçoivent leurs libellés
+def page_rows(table, order, page, page_size, star):
+    start = (page - 1) * page_size
+    return star.label(table.take(order[start:start + page_size]).reset_index(drop=True))
+
+
+# Fonction pour obtenir les n meilleurs clients selon une mesure, sous les filtres
+def top_customers(cube, measure, n, **filters):
+    table = cube.query_keys(['CustomerID'], ['QuantiteVendue', 'MontantVentes'], **filters)
+    return cube.star.label(table.nlargest(n, measure).reset_index(drop=True))
@@ -0,0 +1,96 @@
+import gzip
+import time
+import uuid
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Répertoire des fichiers d'export ; les fichiers plus anciens qu'EXPORT_TTL secondes sont supprimés.
+# Il se trouve dans le dossier static/ de l'application : avec server.enableStaticServing (.streamlit/config.toml),
+# Streamlit sert les exports depuis le disque, par blocs, à la même adresse que l'application
+STATIC_DIR = Path(__file__).resolve().parent / 'static'
+EXPORT_DIR = STATIC_DIR / 'exports'
+EXPORT_TTL = 3600
+# Taille maximale d'un fichier servi par Streamlit depuis static/
+EXPORT_MAX_SERVED_BYTES = 200 * 1024 * 1024
+# Nombre de lignes libellées et écrites à la fois : la mémoire utilisée ne dépend pas de la taille de l'export
+EXPORT_CHUNK_ROWS = 100_000
+
+# Formats proposés : extension et type MIME
+EXPORT_FORMATS = {
+    'CSV': ('.csv', 'text/csv'),
+    'CSV compressé (gzip)': ('.csv.gz', 'application/gzip'),
+    'Parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+
+# Fonction pour découper un résultat sur les clés en blocs libellés, dans l'ordre donné (rows : identifiants de lignes)
+def iter_labeled_chunks(star, table, rows=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    size = len(table) if rows is None else len(rows)
+    for start in range(0, size, chunk_rows):
+        if rows is None:
+            part = table.iloc[start:start + chunk_rows]
+        else:
+            part = table.take(rows[start:start + chunk_rows])
+        yield star.label(part.reset_index(drop=True))
+
+
+# Fonction pour écrire des blocs dans un fichier CSV, CSV gzip ou Parquet ; renvoie le nombre de lignes écrites
+def write_chunks(chunks, fmt, path):
+    rows = 0
+    if fmt == 'Parquet':
+        writer = None
+        try:
+            for chunk in chunks:
+                # Schéma fixé par le premier bloc, pour que tous les blocs aient les mêmes types
+                table = pa.Table.from_pandas(chunk, schema=writer.schema if writer else None, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(str(path), table.schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            path.touch()
+        return rows
+    opener = gzip.open if fmt == 'CSV compressé (gzip)' else open
+    with opener(path, 'wt', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            chunk.to_csv(f, index=False, header=rows == 0)
+            rows += len(chunk)
+    return rows
+
+
+# Fonction pour supprimer les exports expirés
+def clean_exports():
+    if not EXPORT_DIR.exists():
+        return
+    limit = time.time() - EXPORT_TTL
+    for path in EXPORT_DIR.iterdir():
+        if path.stat().st_mtime < limit:
+            path.unlink(missing_ok=True)
+
+
+# Fonction pour produire un fichier d'export à partir de blocs ; renvoie la description du fichier à télécharger
+def export_file(chunks, fmt, basename):
+    clean_exports()
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    extension, mime = EXPORT_FORMATS[fmt]
+    path = EXPORT_DIR / f"{uuid.uuid4().hex}{extension}"
+    start = time.perf_counter()
+    rows = write_chunks(chunks, fmt, path)
+    return {
+        'path': str(path),
+        'file_name': f"{basename}{extension}",
+        'mime': mime,
+        'rows': rows,
+        'size_bytes': path.stat().st_size,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+# Fonction pour obtenir l'adresse de téléchargement d'un export servi par Streamlit (relative à la page)
+def export_url(export):
+    return f"app/static/{EXPORT_DIR.name}/{Path(export['path']).name}"
@@ -0,0 +1,64 @@
+import numpy as np
+
+# Dimensions indexées pour les filtres des rapports
+INDEXED_DIMS = ('Country', 'Month')
+
+
+class FilterIndex:
+    # Listes triées d'identifiants de lignes par valeur de dimension (clé -1 : valeur manquante)
+    def __init__(self, table, key_columns):
+        self.size = len(table)
+        self.postings = {}
+        row_dtype = np.int32 if self.size < 2**31 else np.int64
+        for dim, key in key_columns.items():
+            if key not in table.columns:
+                continue
+            slots = table[key].to_numpy().astype(np.int64) + 1
+            # Tri stable sur le plus petit type entier possible (tri par base pour 8/16 bits)
+            order = np.argsort(slots.astype(np.min_scalar_type(slots.max(initial=0))), kind='stable').astype(row_dtype)
+            offsets = np.zeros(int(slots.max(initial=0)) + 2, dtype=np.int64)
+            np.cumsum(np.bincount(slots, minlength=len(offsets) - 1), out=offsets[1:])
+            self.postings[dim] = (order, offsets)
+
+    # Index reconstitué à partir de listes déjà calculées (instantané d'un jeu de données)
+    @classmethod
+    def from_postings(cls, size, postings):
+        index = cls.__new__(cls)
+        index.size = size
+        index.postings = postings
+        return index
+
+    def __contains__(self, dim):
+        return dim in self.postings
+
+    # Lignes ayant l'une des clés demandées (union des listes)
+    def row_ids(self, dim, keys):
+        order, offsets = self.postings[dim]
+        slots = np.asarray(keys, dtype=np.int64) + 1
+        slots = slots[(slots > 0) & (slots < len(offsets) - 1)]
+        if len(slots) == 0:
+            return order[:0]
+        return np.concatenate([order[offsets[slot]:offsets[slot + 1]] for slot in slots])
+
+    # Vrai si les clés couvrent toutes les lignes (aucun filtrage nécessaire)
+    def covers_all(self, dim, keys):
+        _, offsets = self.postings[dim]
+        counts = np.diff(offsets)
+        if counts[0] > 0:
+            return False
+        present = np.flatnonzero(counts[1:])
+        return np.isin(present, keys).all()
+
+    # Sélection de lignes : OU entre valeurs d'une dimension, ET entre dimensions ; None = toutes les lignes
+    def select(self, filters):
+        mask = None
+        for dim, keys in filters.items():
+            if keys is None or self.covers_all(dim, keys):
+                continue
+            dim_mask = np.zeros(self.size, dtype=bool)
+            dim_mask[self.row_ids(dim, keys)] = True
+            mask = dim_mask if mask is None else mask & dim_mask
+        return None if mask is None else np.flatnonzero(mask)
+
+    def memory_usage(self):
+        return int(sum(order.nbytes + offsets.nbytes for order, offsets in self.postings.values()))
@@ -0,0 +1,348 @@
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
+
+import pandas as pd
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+from profiling import DatasetProfile
+
+# Colonnes attendues dans les fichiers de ventes
+REQUIRED_COLUMNS = ['Country', 'Month', 'CustomerID', 'ProductName', 'QuantiteVendue', 'MontantVentes']
+DIMENSION_COLUMNS = ['Country', 'Month', 'CustomerID', 'ProductName']
+MEASURE_COLUMNS = ['QuantiteVendue', 'MontantVentes']
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# Schéma déclaré à la lecture : les dimensions sont lues comme texte puis stockées en catégories
+READ_DTYPES = {col: str for col in DIMENSION_COLUMNS}
+
+# Nombre de lignes lues à la fois dans les fichiers CSV
+CHUNK_SIZE = 250_000
+
+# Octets lus au début d'un fichier CSV pour son aperçu et l'estimation de son nombre de lignes
+PREVIEW_SAMPLE_BYTES = 1 << 20
+
+# Nombre de feuilles Excel lues en parallèle
+EXCEL_WORKERS = int(os.environ.get('VENTES_EXCEL_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Blocs lus d'avance par feuille : une feuille en avance attend que ses blocs soient consommés
+EXCEL_PREFETCH_CHUNKS = 2
+
+
+class MissingColumnsError(ValueError):
+    def __init__(self, missing, sheet=None):
+        where = f" dans la feuille {sheet}" if sheet is not None else ""
+        super().__init__(f"Colonnes manquantes{where} : {', '.join(missing)}")
+        self.missing = missing
+        self.sheet = sheet
+
+
+# Fonction pour vérifier la présence des colonnes nécessaires (sheet : feuille Excel concernée)
+def check_required_columns(columns, sheet=None):
+    missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+    if missing:
+        raise MissingColumnsError(missing, sheet)
+
+
+# Fonction pour reconnaître une feuille de ventes d'après ses colonnes : vrai si toutes les colonnes nécessaires
+# sont présentes, faux si aucune ne l'est (feuille de garde, notes), MissingColumnsError si seules certaines le sont
+def is_sales_sheet(columns, sheet=None):
+    if not any(col in columns for col in REQUIRED_COLUMNS):
+        return False
+    check_required_columns(columns, sheet)
+    return True
+
+
+# Fonction pour réduire le type d'une mesure sans perte de précision
+def downcast_measure(series):
+    series = pd.to_numeric(series)
+    if pd.api.types.is_float_dtype(series):
+        if series.notna().all() and (series % 1 == 0).all():
+            return pd.to_numeric(series, downcast='integer')
+        as_float32 = series.astype('float32')
+        if (as_float32.astype(series.dtype) == series).all():
+            return as_float32
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast='integer')
+    return series
+
+
+# Fonction pour compacter un bloc : dimensions en catégories, mesures réduites
+def compact_frame(df):
+    for col in DIMENSION_COLUMNS:
+        df[col] = df[col].astype('category')
+    for col in MEASURE_COLUMNS:
+        df[col] = downcast_measure(df[col])
+    if 'MonthOrder' in df.columns:
+        df['MonthOrder'] = downcast_measure(df['MonthOrder'])
+    return df
+
+
+# Fonction pour assembler des blocs compacts en unifiant les catégories
+def concat_compact_frames(frames):
+    if len(frames) == 1:
+        return frames[0]
+    columns = frames[0].columns
+    categorical = [col for col in columns if isinstance(frames[0][col].dtype, pd.CategoricalDtype)]
+    combined = pd.concat([frame.drop(columns=categorical) for frame in frames], ignore_index=True)
+    for col in categorical:
+        combined[col] = union_categoricals([frame[col] for frame in frames], sort_categories=True)
+    for col in MEASURE_COLUMNS:
+        if col in combined.columns:
+            combined[col] = downcast_measure(combined[col])
+    return combined[columns]
+
+
+# Fonction pour ajouter MonthOrder ; renvoie False si les mois ne sont pas reconnus
+def add_month_order(df):
+    unique_months = df['Month'].unique()
+    if set(unique_months).issubset(set(MONTHS)):
+        month_order = {month: i for i, month in enumerate(MONTHS)}
+        recognized = True
+    else:
+        month_order = {month: i for i, month in enumerate(unique_months)}
+        recognized = False
+    df['MonthOrder'] = downcast_measure(df['Month'].map(month_order).astype('float64'))
+    return recognized
+
+
+# Fonction pour convertir une dimension en texte, valeurs manquantes conservées
+def as_text(series):
+    return series.where(series.isna(), series.astype(str))
+
+
+# Fonction pour relire en entiers les nombres entiers d'une colonne rendue flottante par une cellule vide
+# (10475 et non 10475.0, comme à la lecture par pandas)
+def integral_floats(series):
+    if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+        return series.astype('Int64').astype(object)
+    return series
+
+
+# Fonction pour ouvrir un classeur XLSX en lecture seule : les lignes sont lues à la demande, feuille par feuille
+def open_workbook(source):
+    import openpyxl
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+
+# Fonction pour lire une feuille ligne à ligne par blocs de chunksize lignes ; la première ligne est l'en-tête.
+# Une feuille vide ou sans aucune colonne de ventes est ignorée (info['Statut'] l'indique), une feuille à laquelle
+# il ne manque qu'une partie des colonnes obligatoires est refusée
+def iter_sheet_chunks(worksheet, chunksize=CHUNK_SIZE, columns=None, info=None):
+    info = info if info is not None else {}
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None or all(value is None for value in header):
+        info['Statut'] = "vide"
+        return
+    header = [str(value) if value is not None else f"Unnamed: {i}" for i, value in enumerate(header)]
+    if not is_sales_sheet(header, worksheet.title):
+        info['Statut'] = "ignorée : aucune colonne de ventes"
+        return
+    info['Statut'] = "lue"
+    keep = [i for i, col in enumerate(header) if columns is None or col in columns]
+    for block in iter(lambda: list(islice(rows, chunksize)), []):
+        # Lignes entièrement vides ignorées, comme à la lecture par pandas
+        chunk = pd.DataFrame.from_records(block).dropna(how='all')
+        if chunk.empty:
+            continue
+        chunk = chunk.reindex(columns=keep)
+        chunk.columns = [header[i] for i in keep]
+        for col in DIMENSION_COLUMNS:
+            if col in chunk.columns:
+                chunk[col] = as_text(integral_floats(chunk[col]))
+        yield chunk.reset_index(drop=True)
+
+
+# Fonction pour lire toutes les feuilles d'un classeur XLSX en parallèle et en flux ; renvoie des couples
+# ((feuille, bloc), DataFrame) dans l'ordre où les blocs sont prêts. La file d'attente est bornée : la mémoire
+# ne dépend que de la taille des blocs, pas de celle du classeur. sheets reçoit, par feuille, le nombre de
+# lignes, le temps de lecture (hors attente de la file), le débit et si elle a été lue ou ignorée.
+def iter_excel_chunks(source, chunksize=CHUNK_SIZE, columns=None, workers=EXCEL_WORKERS, sheets=None):
+    workbook = open_workbook(source)
+    worksheets = workbook.worksheets
+    workers = max(1, min(workers, len(worksheets)))
+    stats = [{'Feuille': worksheet.title, 'Statut': None, 'Lignes': 0, 'Lecture (s)': 0.0, 'Lignes/s': None}
+             for worksheet in worksheets]
+    if sheets is not None:
+        sheets.extend(stats)
+    ready = queue.Queue(maxsize=workers * EXCEL_PREFETCH_CHUNKS)
+    stop = threading.Event()
+
+    # Dépôt dans la file, abandonné si la lecture est interrompue côté consommateur
+    def put(item):
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read_sheet(position):
+        info = stats[position]
+        try:
+            chunks = iter_sheet_chunks(worksheets[position], chunksize, columns, info)
+            for index in count():
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                info['Lecture (s)'] += time.perf_counter() - start
+                if chunk is None:
+                    break
+                info['Lignes'] += len(chunk)
+                if not put((position, index, chunk)):
+                    return
+            if info['Lecture (s)'] > 0:
+                info['Lignes/s'] = info['Lignes'] / info['Lecture (s)']
+            put((position, None, None))
+        except Exception as e:
+            put((position, None, e))
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='excel')
+    try:
+        for position in range(len(worksheets)):
+            pool.submit(read_sheet, position)
+        remaining = len(worksheets)
+        read = False
+        while remaining:
+            position, index, item = ready.get()
+            if isinstance(item, Exception):
+                raise item
+            if item is None:
+                remaining -= 1
+                continue
+            read = True
+            yield (position, index), item
+        if not read and any(info['Statut'] == "ignorée : aucune colonne de ventes" for info in stats):
+            raise MissingColumnsError(REQUIRED_COLUMNS)
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        workbook.close()
+
+
+# Fonction pour parcourir un fichier de ventes par blocs, dimensions lues en texte ;
+# columns limite la lecture aux colonnes utiles. Toutes les feuilles d'un classeur Excel sont lues.
+def iter_sales_chunks(source, name, chunksize=CHUNK_SIZE, columns=None):
+    if name.endswith('.csv'):
+        usecols = (lambda col: col in columns) if columns is not None else None
+        yield from pd.read_csv(source, dtype=READ_DTYPES, chunksize=chunksize, usecols=usecols)
+    elif name.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(source)
+        if columns is not None:
+            columns = [col for col in parquet_file.schema_arrow.names if col in columns]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            chunk = batch.to_pandas()
+            for col in DIMENSION_COLUMNS:
+                if col in chunk.columns:
+                    chunk[col] = as_text(chunk[col])
+            yield chunk
+    elif name.endswith('.xlsx'):
+        for _, chunk in iter_excel_chunks(source, chunksize, columns):
+            yield chunk
+    else:
+        # Ancien format .xls : pas de lecture en flux, chaque feuille est lue en entier ; les feuilles sans
+        # colonnes de ventes sont ignorées comme pour .xlsx
+        sheets = pd.read_excel(source, sheet_name=None, dtype=READ_DTYPES)
+        sales = {sheet: chunk for sheet, chunk in sheets.items() if is_sales_sheet(chunk.columns, sheet)}
+        if not sales and any(len(chunk.columns) for chunk in sheets.values()):
+            raise MissingColumnsError(REQUIRED_COLUMNS)
+        for chunk in sales.values():
+            yield chunk if columns is None else chunk[[col for col in chunk.columns if col in columns]]
+
+
+# Fonction pour lire un fichier de ventes par blocs typés et compacts ;
+# progress(étape, lignes) est appelé après chaque bloc et peut interrompre la lecture en levant une exception
+def read_sales_file(source, name, chunksize=CHUNK_SIZE, progress=None):
+    report = {'rows': 0, 'raw_bytes': 0, 'compact_bytes': 0, 'months_recognized': True}
+    # Profil des colonnes calculé pendant la lecture, sans seconde passe
+    profile = report['profile'] = DatasetProfile()
+    if name.endswith('.xlsx'):
+        # Feuilles lues en parallèle ; report['sheets'] donne le débit de chaque feuille
+        report['sheets'] = []
+        chunks = iter_excel_chunks(source, chunksize, sheets=report['sheets'])
+    else:
+        chunks = (((0, index), chunk) for index, chunk in enumerate(iter_sales_chunks(source, name, chunksize)))
+    frames = []
+    for position, chunk in chunks:
+        if not frames:
+            check_required_columns(chunk.columns)
+        report['raw_bytes'] += int(chunk.memory_usage(deep=True).sum())
+        report['rows'] += len(chunk)
+        frames.append((position, compact_frame(chunk)))
+        profile.update(chunk)
+        if progress is not None:
+            progress('Lecture et compactage', report['rows'])
+    if not frames:
+        raise ValueError("Le fichier ne contient aucune donnée.")
+
+    if progress is not None:
+        progress('Assemblage des blocs', report['rows'])
+    # Blocs remis dans l'ordre du fichier (les feuilles lues en parallèle arrivent dans le désordre) ;
+    # seules les colonnes présentes dans toutes les feuilles sont conservées
+    frames = [frame for _, frame in sorted(frames, key=lambda item: item[0])]
+    columns = [col for col in frames[0].columns if all(col in frame.columns for frame in frames)]
+    if any(len(frame.columns) != len(columns) for frame in frames):
+        frames = [frame[columns] for frame in frames]
+    df = concat_compact_frames(frames)
+    if 'MonthOrder' not in df.columns:
+        if progress is not None:
+            progress('Ordre des mois', report['rows'])
+        report['months_recognized'] = add_month_order(df)
+    report['compact_bytes'] = int(df.memory_usage(deep=True).sum())
+    return df, report
+
+
+# Fonction pour lire les n premières lignes d'un fichier et son nombre de lignes, sans le charger entièrement ;
+# renvoie (aperçu, lignes ou None, vrai si le nombre de lignes est estimé)
+def preview_source(path, n=5):
+    if path.endswith('.csv'):
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            sample = f.read(PREVIEW_SAMPLE_BYTES)
+        if len(sample) == size:
+            # Petit fichier lu en entier : nombre exact (retours à la ligne entre guillemets compris)
+            df = pd.read_csv(io.BytesIO(sample), dtype=READ_DTYPES)
+            return df.head(n), len(df), False
+        # Gros fichier : estimation d'après la largeur moyenne des lignes de l'échantillon, sans lire la suite
+        sample = sample[:sample.rfind(b'\n') + 1]
+        header = sample.find(b'\n') + 1
+        try:
+            df = pd.read_csv(io.BytesIO(sample), dtype=READ_DTYPES)
+        except pd.errors.ParserError:
+            # Échantillon coupé au milieu d'un champ entre guillemets
+            return pd.read_csv(path, dtype=READ_DTYPES, nrows=n), None, False
+        rows = round(len(df) * (size - header) / (len(sample) - header)) if len(df) else None
+        return df.head(n), rows, True
+    if path.endswith('.parquet'):
+        return next(iter_sales_chunks(path, path, n)).head(n), pq.ParquetFile(path).metadata.num_rows, False
+    if not path.endswith('.xlsx'):
+        return pd.read_excel(path, dtype=READ_DTYPES, nrows=n), None, False
+    # Aperçu de la première feuille de ventes (feuilles de garde et de notes ignorées) ; lignes des feuilles
+    # de ventes d'après les dimensions déclarées, sans lire les cellules
+    workbook = open_workbook(path)
+    sales = []
+    for worksheet in workbook.worksheets:
+        header = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+        if any(col in [str(value) for value in header] for col in REQUIRED_COLUMNS):
+            sales.append(worksheet)
+    sizes = [worksheet.max_row for worksheet in sales]
+    rows = sum(size - 1 for size in sizes if size) if all(size is not None for size in sizes) else None
+    sheet = sales[0].title if sales else 0
+    workbook.close()
+    return pd.read_excel(path, sheet_name=sheet, dtype=READ_DTYPES, nrows=n), rows, False
+
+
+# Fonction pour afficher une taille en octets
+def format_bytes(size):
+    for unit in ['o', 'Ko', 'Mo', 'Go']:
+        if size < 1024 or unit == 'Go':
+            return f"{size:,.1f} {unit}" if unit != 'o' else f"{size} o"
+        size /= 1024
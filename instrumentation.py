@@ -0,0 +1,137 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from store import STORE_DIR
+
+# Journal des exécutions instrumentées : une ligne JSON par exécution du script, rangé avec le stock de données
+PROFILE_LOG = os.environ.get('VENTES_PROFILE_LOG', str(STORE_DIR / 'ventes_profile.jsonl'))
+# Instrumentation activée d'office pour toutes les sessions (sinon, sur demande depuis la barre latérale)
+PROFILE_DEFAULT = os.environ.get('VENTES_PROFILE', '0') == '1'
+
+_local = threading.local()
+_log_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+_null_stage = contextlib.nullcontext()
+
+
+class RunProfile:
+    # Mesures d'une exécution du script : durée et mémoire allouée (tracemalloc) de chaque étape nommée,
+    # succès ou échec de chaque accès au cache des résultats
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        # Pile des étapes ouvertes : plus haut niveau de mémoire observé dans chacune
+        self._open = []
+        self.total_seconds = None
+
+    @contextlib.contextmanager
+    def stage(self, name, kind='stage'):
+        record = {'stage': name, 'kind': kind, 'depth': len(self._open)}
+        self.stages.append(record)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self._open.append(current)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            after, peak = tracemalloc.get_traced_memory()
+            # Le pic d'une étape englobe ceux de ses sous-étapes (reset_peak les remet à zéro)
+            peak = max(peak, self._open.pop())
+            if self._open:
+                self._open[-1] = max(self._open[-1], peak)
+            record['allocated_bytes'] = after - current
+            record['peak_bytes'] = peak - current
+
+    def to_record(self):
+        return {
+            'time': self.timestamp,
+            'page': self.page,
+            'total_seconds': self.total_seconds,
+            'stages': self.stages,
+        }
+
+    # Tableau des étapes pour le panneau de diagnostic (étapes imbriquées indentées)
+    def frame(self):
+        return pd.DataFrame({
+            'Étape': [' ' * s['depth'] + s['stage'] for s in self.stages],
+            'Durée (ms)': [s['seconds'] * 1000 for s in self.stages],
+            'Mémoire allouée (Ko)': [s['allocated_bytes'] / 1024 for s in self.stages],
+            'Pic (Ko)': [s['peak_bytes'] / 1024 for s in self.stages],
+            'Cache': [s.get('cache', '') for s in self.stages],
+        })
+
+
+# Fonction pour démarrer l'instrumentation d'une exécution du script dans le thread courant
+def start_run(page):
+    global _tracing_runs
+    with _tracing_lock:
+        # tracemalloc est global au processus : actif tant qu'au moins une exécution est instrumentée
+        if _tracing_runs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_runs += 1
+    _local.run = RunProfile(page)
+    return _local.run
+
+
+# Fonction pour terminer l'exécution instrumentée : durée totale, ajout au journal
+def finish_run(log_path=PROFILE_LOG):
+    global _tracing_runs
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return None
+    _local.run = None
+    run.total_seconds = time.perf_counter() - run.started
+    with _tracing_lock:
+        _tracing_runs -= 1
+        if _tracing_runs == 0:
+            tracemalloc.stop()
+    if log_path:
+        line = json.dumps(run.to_record(), ensure_ascii=False)
+        Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+        with _log_lock, open(log_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    return run
+
+
+# Fonction pour mesurer une étape ; sans exécution instrumentée, un contexte vide est renvoyé (coût négligeable)
+def stage(name, kind='stage'):
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return _null_stage
+    return run.stage(name, kind)
+
+
+# Fonction pour mesurer un accès au cache des résultats : le calcul n'est appelé qu'en cas d'échec
+def cached_stage(name, lookup, compute):
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return lookup(compute)
+    with run.stage(name, 'cache') as record:
+        record['cache'] = 'succès'
+
+        def measured():
+            record['cache'] = 'échec'
+            return compute()
+        return lookup(measured)
+
+
+# Fonction pour relire les dernières exécutions du journal
+def read_log(log_path=PROFILE_LOG, limit=200):
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, encoding='utf-8') as f:
+        lines = f.readlines()[-limit:]
+    return [json.loads(line) for line in lines if line.strip()]
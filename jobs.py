@@ -0,0 +1,119 @@
+import io
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog import build_catalog
+from cube import build_cube
+from ingest import read_sales_file
+from registry import Dataset
+from star_schema import build_star_schema
+
+# Étapes d'un import, dans l'ordre (pour la barre de progression)
+INGEST_STAGES = ['En attente', 'Lecture et compactage', 'Assemblage des blocs', 'Ordre des mois',
+                 'Schéma en étoile', 'Cube', 'Catalogue', 'Publication', 'Terminé']
+# Nombre d'imports terminés conservés pour l'affichage
+FINISHED_JOBS_KEPT = 20
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+class IngestJob:
+    # Import d'un fichier en arrière-plan : étape, lignes lues, puis jeu de données publié dans le registre ou erreur
+    def __init__(self, key, filename, data):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.filename = filename
+        self.status = 'pending'
+        self.stage = INGEST_STAGES[0]
+        self.rows = 0
+        self.report = None
+        self.dataset = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self._data = data
+        self._cancel = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in ('pending', 'running')
+
+    # Avancement approximatif, d'après l'étape en cours
+    @property
+    def fraction(self):
+        return INGEST_STAGES.index(self.stage) / (len(INGEST_STAGES) - 1)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.submitted
+
+    def cancel(self):
+        self._cancel.set()
+
+    # Passage à une étape ; l'annulation est prise en compte entre deux blocs ou deux étapes
+    def update(self, stage, rows=None):
+        if self._cancel.is_set():
+            raise IngestCancelled()
+        self.stage = stage
+        if rows is not None:
+            self.rows = rows
+
+    def run(self, registry):
+        try:
+            self.status = 'running'
+            self.update(INGEST_STAGES[0])
+            df, self.report = read_sales_file(io.BytesIO(self._data), self.filename, progress=self.update)
+            self._data = None
+            self.update('Schéma en étoile')
+            star = build_star_schema(df)
+            del df
+            self.update('Cube')
+            cube = build_cube(star)
+            self.update('Catalogue')
+            catalog = build_catalog(star)
+            self.update('Publication')
+            # Publication atomique : le jeu n'est visible qu'une fois entièrement construit
+            self.dataset = registry.put(Dataset(self.key, star, cube, catalog=catalog, profile=self.report['profile']))
+            self.stage = 'Terminé'
+            self.status = 'done'
+        except IngestCancelled:
+            self.status = 'cancelled'
+        except Exception as e:
+            self.error = e
+            self.status = 'failed'
+        finally:
+            self._data = None
+            self.finished = time.time()
+
+
+class IngestJobManager:
+    # Pool d'imports partagé par les sessions ; un même contenu n'est importé qu'une fois à la fois
+    def __init__(self, registry, workers=2):
+        self.registry = registry
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, filename, data):
+        with self._lock:
+            for job in self._jobs.values():
+                if job.key == key and job.active:
+                    return job
+            job = IngestJob(key, filename, data)
+            self._jobs[job.id] = job
+            self._prune()
+        self._pool.submit(job.run, self.registry)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        finished = sorted((job for job in self._jobs.values() if not job.active), key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self._jobs[job.id]
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import store
+from ingest import DIMENSION_COLUMNS, add_month_order, concat_compact_frames, read_sales_file
+from profiling import DatasetProfile
+
+# Nombre de fichiers lus en parallèle
+MERGE_WORKERS = int(os.environ.get('VENTES_MERGE_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+
+# Fonction pour lire un fichier source en mesurant le temps de lecture
+def parse_source(path):
+    start = time.perf_counter()
+    df, report = read_sales_file(path, path)
+    key = store.content_hash(path)
+    return df, {
+        'Fichier': path,
+        'Lignes': report['rows'],
+        'Taille': os.path.getsize(path),
+        'Lecture (s)': time.perf_counter() - start,
+        'key': key,
+        'months_recognized': report['months_recognized'],
+    }
+
+
+# Fonction pour décrire le schéma d'un DataFrame : dimension (texte) ou mesure (numérique) par colonne
+def frame_schema(df):
+    return {col: 'numeric' if pd.api.types.is_numeric_dtype(df[col]) else 'text' for col in df.columns}
+
+
+# Fonction pour vérifier que tous les fichiers ont le même schéma que le premier
+def check_schemas(frames, names):
+    expected = frame_schema(frames[0])
+    problems = []
+    for df, name in zip(frames[1:], names[1:]):
+        schema = frame_schema(df)
+        if schema != expected:
+            different = sorted(set(schema.items()) ^ set(expected.items()))
+            problems.append(f"{name} ({', '.join(sorted({col for col, _ in different}))})")
+    if problems:
+        raise store.SchemaMismatchError(f"schéma différent de {names[0]} : " + "; ".join(problems))
+
+
+# Fonction pour donner aux colonnes d'une ligne un type commun à tous les fichiers (chaque fichier est réduit
+# différemment) : dimensions en texte, quantités en entiers 64 bits, montants en float64
+def normalized_rows(df):
+    columns = {}
+    for col in DIMENSION_COLUMNS:
+        values = df[col].astype('category')
+        # Libellés convertis une fois par catégorie, pas par ligne
+        columns[col] = pd.Categorical.from_codes(values.cat.codes, values.cat.categories.astype(str))
+    try:
+        columns['QuantiteVendue'] = df['QuantiteVendue'].astype('Int64')
+    except (TypeError, ValueError):
+        # Quantités non entières : comparées en float64
+        columns['QuantiteVendue'] = df['QuantiteVendue'].astype('float64')
+    columns['MontantVentes'] = df['MontantVentes'].astype('float64')
+    return pd.DataFrame(columns)
+
+
+# Fonction pour retirer les lignes déjà présentes dans un fichier précédent (empreinte du contenu de la ligne) ;
+# les doublons à l'intérieur d'un même fichier sont des transactions distinctes et sont conservés
+def drop_overlaps(frames):
+    seen = np.empty(0, dtype=np.uint64)
+    kept = []
+    removed = []
+    for df in frames:
+        hashes = pd.util.hash_pandas_object(normalized_rows(df), index=False).to_numpy()
+        overlap = np.isin(hashes, seen)
+        kept.append(df[~overlap].reset_index(drop=True) if overlap.any() else df)
+        removed.append(int(overlap.sum()))
+        seen = np.union1d(seen, hashes)
+    return kept, removed
+
+
+# Fonction pour fusionner plusieurs fichiers de ventes lus en parallèle en un seul DataFrame compact
+def merge_sources(paths, workers=MERGE_WORKERS):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='merge') as pool:
+        results = list(pool.map(parse_source, paths))
+    frames = [df for df, _ in results]
+    files = [info for _, info in results]
+    check_schemas(frames, paths)
+    frames, removed = drop_overlaps(frames)
+    df = concat_compact_frames(frames)
+    months_recognized = all([info.pop('months_recognized') for info in files])
+    if not months_recognized:
+        # Mois non reconnus : l'ordre d'apparition de chaque fichier est remplacé par celui de l'ensemble
+        df = df.drop(columns='MonthOrder')
+        add_month_order(df)
+    elapsed = time.perf_counter() - start
+
+    for info, count in zip(files, removed):
+        info['Doublons retirés'] = count
+        info['Lignes/s'] = info['Lignes'] / info['Lecture (s)'] if info['Lecture (s)'] else None
+    key = hashlib.sha256('|'.join(sorted(info.pop('key') for info in files)).encode()).hexdigest()
+    total_bytes = sum(info['Taille'] for info in files)
+    report = {
+        'files': pd.DataFrame(files),
+        'rows': len(df),
+        'removed': sum(removed),
+        'months_recognized': months_recognized,
+        'seconds': elapsed,
+        'rows_per_second': sum(info['Lignes'] for info in files) / elapsed if elapsed else None,
+        'bytes_per_second': total_bytes / elapsed if elapsed else None,
+        # Profil recalculé après retrait des doublons
+        'profile': DatasetProfile().update(df[[col for col in df.columns if col != 'MonthOrder']]),
+    }
+    return df, key, report
@@ -0,0 +1,57 @@
+import time
+
+from instrumentation import stage
+
+
+# Fonction pour figer une valeur d'entrée (listes, dictionnaires) en une forme comparable d'une exécution à l'autre
+def freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    return value
+
+
+class PanelGraph:
+    # Graphe de dépendances des panneaux d'une page : entrées (widgets, jeu actif) → agrégats → graphiques.
+    # La signature d'un nœud est dérivée des valeurs de ses dépendances ; son résultat est rangé sous cette signature
+    # dans le cache des résultats (borné en octets, partagé par les sessions), la session ne conserve rien. À chaque
+    # exécution, un nœud n'est recalculé que si une dépendance a changé ou si son résultat a été évincé.
+    def __init__(self, cache, page):
+        self._cache = cache
+        self._page = page
+        self._signatures = {}
+
+    # Déclaration d'une entrée : sa valeur figée fait partie de la signature des nœuds qui en dépendent
+    def input(self, name, value):
+        value = freeze(value)
+        self._signatures[name] = ('input', value)
+        return value
+
+    def _signature(self, name):
+        signature = self._signatures.get(name)
+        if signature is None:
+            raise KeyError(f"Dépendance inconnue : {name}")
+        return signature
+
+    # Nœud calculé à partir de ses dépendances (entrées ou nœuds déclarés plus haut dans la page)
+    def node(self, name, deps, compute):
+        signature = self._signatures[name] = (name, tuple((dep, self._signature(dep)) for dep in deps))
+        key = ('panel', self._page, signature)
+        with stage(name, 'panel') as record:
+            entry = self._cache.get(key)
+            if entry is not None:
+                value, seconds = entry
+                if record is not None:
+                    record['cache'] = 'réutilisé'
+                    record['saved_seconds'] = seconds
+                return value
+            start = time.perf_counter()
+            value = compute()
+            seconds = time.perf_counter() - start
+            self._cache.get_or_compute(key, lambda: (value, seconds))
+            if record is not None:
+                record['cache'] = 'recalculé'
+            return value
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+from sketches import HyperLogLog, hash_values
+
+# Taille de l'échantillon conservé par colonne numérique pour les quantiles approchés
+SAMPLE_SIZE = 10_000
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+class ColumnProfile:
+    # Statistiques d'une colonne accumulées bloc par bloc : comptes, min/max, moyenne et variance (fusion de Chan),
+    # valeurs distinctes (HyperLogLog) et échantillon bottom-k (quantiles approchés)
+    def __init__(self, numeric):
+        self.numeric = numeric
+        self.count = 0
+        self.nulls = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.distinct = HyperLogLog()
+        self.sample = np.empty(0)
+        self.priorities = np.empty(0)
+
+    def update(self, series, rng):
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Dimension compactée : seules les catégories présentes dans le bloc sont hachées
+            self.distinct.add_hashes(hash_values(values.cat.categories.to_numpy(dtype=object)))
+            values = values.cat.codes
+        else:
+            self.distinct.add(values.to_numpy())
+        if not self.numeric:
+            self.count += len(values)
+            return
+        values = pd.to_numeric(values, errors='coerce').dropna().to_numpy(dtype=np.float64)
+        chunk = ColumnProfile(True)
+        chunk.count = len(values)
+        if chunk.count:
+            chunk.mean = float(values.mean())
+            chunk.m2 = float(((values - chunk.mean) ** 2).sum())
+            chunk.min = float(values.min())
+            chunk.max = float(values.max())
+            chunk.priorities = rng.random(len(values))
+            keep = np.argsort(chunk.priorities)[:SAMPLE_SIZE]
+            chunk.sample = values[keep]
+            chunk.priorities = chunk.priorities[keep]
+        self._merge_moments(chunk)
+
+    def _merge_moments(self, other):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+        else:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.count = count
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        # Échantillon bottom-k : les k plus petites priorités aléatoires forment un échantillon uniforme
+        priorities = np.concatenate([self.priorities, other.priorities])
+        sample = np.concatenate([self.sample, other.sample])
+        keep = np.argsort(priorities)[:SAMPLE_SIZE]
+        self.priorities, self.sample = priorities[keep], sample[keep]
+
+    def merge(self, other):
+        merged = ColumnProfile(self.numeric)
+        merged.nulls = self.nulls + other.nulls
+        merged.distinct = self.distinct.merge(other.distinct)
+        if self.numeric:
+            merged._merge_moments(self)
+            merged._merge_moments(other)
+        else:
+            merged.count = self.count + other.count
+        return merged
+
+    def summary(self):
+        summary = {
+            'type': 'numeric' if self.numeric else 'text',
+            'count': self.count,
+            'nulls': self.nulls,
+            'distinct': min(self.distinct.count(), self.count),
+        }
+        if self.numeric and self.count:
+            quantiles = np.quantile(self.sample, QUANTILES)
+            summary.update({
+                'min': self.min,
+                'max': self.max,
+                'mean': self.mean,
+                'std': float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else None,
+                'q25': float(quantiles[0]),
+                'q50': float(quantiles[1]),
+                'q75': float(quantiles[2]),
+            })
+        return summary
+
+
+class DatasetProfile:
+    # Profil des colonnes d'un jeu de données, calculé pendant la lecture des blocs
+    def __init__(self, columns=None, seed=0):
+        self.columns = columns or {}
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, chunk):
+        for col in chunk.columns:
+            profile = self.columns.get(col)
+            if profile is None:
+                numeric = pd.api.types.is_numeric_dtype(chunk[col]) and not isinstance(chunk[col].dtype, pd.CategoricalDtype)
+                profile = self.columns[col] = ColumnProfile(numeric)
+            profile.update(chunk[col], self._rng)
+        return self
+
+    def merge(self, other):
+        columns = {col: profile.merge(other.columns[col]) if col in other.columns else profile
+                   for col, profile in self.columns.items()}
+        return DatasetProfile(columns)
+
+    def summary(self):
+        return {col: profile.summary() for col, profile in self.columns.items()}
+
+    # Sauvegarde de l'état complet (registres et échantillons), pour fusionner les lots ajoutés plus tard
+    def save(self, path):
+        arrays = {}
+        for col, profile in self.columns.items():
+            arrays[f"{col}.scalars"] = np.array([profile.numeric, profile.count, profile.nulls, profile.mean, profile.m2,
+                                                 np.nan if profile.min is None else profile.min,
+                                                 np.nan if profile.max is None else profile.max])
+            arrays[f"{col}.registers"] = profile.distinct.registers
+            arrays[f"{col}.sample"] = profile.sample
+            arrays[f"{col}.priorities"] = profile.priorities
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        columns = {}
+        with np.load(path) as arrays:
+            for name in arrays.files:
+                col, field = name.rsplit('.', 1)
+                if field != 'scalars':
+                    continue
+                numeric, count, nulls, mean, m2, low, high = arrays[name]
+                profile = ColumnProfile(bool(numeric))
+                profile.count, profile.nulls, profile.mean, profile.m2 = int(count), int(nulls), float(mean), float(m2)
+                profile.min = None if np.isnan(low) else float(low)
+                profile.max = None if np.isnan(high) else float(high)
+                profile.distinct = HyperLogLog(registers=arrays[f"{col}.registers"].copy())
+                profile.sample = arrays[f"{col}.sample"]
+                profile.priorities = arrays[f"{col}.priorities"]
+                columns[col] = profile
+        return cls(columns)
+
+
+# Fonction pour présenter un résumé de profil sous forme de tableau (une ligne par colonne)
+def profile_frame(summary):
+    labels = {
+        'type': 'Type', 'count': 'Valeurs', 'nulls': 'Manquantes', 'distinct': 'Distinctes (≈)',
+        'min': 'Min', 'q25': '25 % (≈)', 'q50': 'Médiane (≈)', 'q75': '75 % (≈)', 'max': 'Max',
+        'mean': 'Moyenne', 'std': 'Écart-type',
+    }
+    frame = pd.DataFrame.from_dict(summary, orient='index')
+    frame = frame[[key for key in labels if key in frame.columns]].rename(columns=labels)
+    frame['Type'] = frame['Type'].map({'numeric': 'mesure', 'text': 'dimension'})
+    return frame.rename_axis('Colonne').reset_index()
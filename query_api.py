@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pyarrow as pa
+
+import store
+from cube import MEASURES, CuboidUnavailableError
+from result_cache import canonical_filters
+from star_schema import KEY_COLUMNS
+
+# Service HTTP local d'agrégats sur le jeu de données actif, à côté de l'application Streamlit :
+#   GET /health                         jeu actif, dimensions et mesures disponibles
+#   GET /query?measures=MontantVentes&by=Country&by=Month&Country=France&Country=Spain&format=arrow
+# measures et by acceptent des listes séparées par des virgules ; les filtres (Country, Month, CustomerID,
+# ProductName) se répètent, une valeur par paramètre. dataset=<nom> interroge un jeu stocké plutôt que le jeu actif.
+QUERY_API_ENABLED = os.environ.get('VENTES_QUERY_API', '1') == '1'
+QUERY_API_HOST = os.environ.get('VENTES_QUERY_HOST', '127.0.0.1')
+QUERY_API_PORT = int(os.environ.get('VENTES_QUERY_PORT', '8502'))
+# Calculs simultanés : les réponses en cache et les 304 n'attendent jamais, les autres requêtes font la queue
+# pour ne pas disputer le processeur aux exécutions du tableau de bord
+QUERY_API_WORKERS = int(os.environ.get('VENTES_QUERY_WORKERS', '1'))
+# Nombre maximal de lignes renvoyées par requête
+QUERY_MAX_ROWS = int(os.environ.get('VENTES_QUERY_MAX_ROWS', '100000'))
+QUERY_FORMATS = {'json': 'application/json', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+
+class QueryError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# Fonction pour lire une liste de noms : paramètres répétés et/ou valeurs séparées par des virgules
+def split_names(values):
+    return [name.strip() for value in values for name in value.split(',') if name.strip()]
+
+
+# Fonction pour valider les paramètres d'une requête d'agrégat ; renvoie la requête normalisée
+def parse_query(params):
+    measures = split_names(params.get('measures', [])) or list(MEASURES)
+    by = split_names(params.get('by', []))
+    unknown = [name for name in measures if name not in MEASURES] + [name for name in by if name not in KEY_COLUMNS]
+    if unknown:
+        raise QueryError(f"Mesures ou dimensions inconnues : {', '.join(unknown)}")
+    if len(set(by)) != len(by) or len(set(measures)) != len(measures):
+        raise QueryError("Mesure ou dimension demandée plusieurs fois")
+    fmt = params.get('format', ['json'])[-1]
+    if fmt not in QUERY_FORMATS:
+        raise QueryError(f"Format inconnu : {fmt} (formats : {', '.join(QUERY_FORMATS)})")
+    try:
+        limit = int(params['limit'][-1]) if 'limit' in params else QUERY_MAX_ROWS
+    except ValueError:
+        raise QueryError("limit doit être un entier")
+    if limit <= 0:
+        raise QueryError("limit doit être positif")
+    return {
+        'measures': measures,
+        'by': by,
+        'filters': {dim: params[dim] for dim in KEY_COLUMNS if dim in params},
+        'format': fmt,
+        'limit': min(limit, QUERY_MAX_ROWS),
+    }
+
+
+# Fonction pour calculer l'ETag d'une requête : il ne dépend que de la version du jeu (clé de contenu)
+# et de la requête normalisée, et se calcule sans exécuter la requête
+def query_etag(dataset_key, query):
+    filters = sorted((dim, sorted(labels)) for dim, labels in query['filters'].items())
+    signature = json.dumps([dataset_key, query['measures'], query['by'], filters, query['format'], query['limit']],
+                           ensure_ascii=False)
+    return '"' + hashlib.sha256(signature.encode()).hexdigest()[:32] + '"'
+
+
+# Fonction pour exécuter une requête d'agrégat sur le cube ; lignes dans l'ordre des dimensions (mois chronologiques)
+def run_query(dataset, query):
+    try:
+        table = dataset.cube.query(query['by'], query['measures'], **query['filters'])
+    except CuboidUnavailableError as e:
+        raise QueryError(f"Agrégat indisponible sur ce jeu de données : {e}", 422)
+    order = ['MonthOrder' if dim == 'Month' else dim for dim in query['by']]
+    if order:
+        table = table.sort_values(order, kind='stable')
+    table = table[query['by'] + query['measures']].reset_index(drop=True)
+    return table.head(query['limit']), len(table)
+
+
+# Fonction pour encoder un résultat : flux Arrow IPC, ou JSON {columns, data}
+def encode_table(table, fmt):
+    if fmt == 'arrow':
+        arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+        return sink.getvalue().to_pybytes()
+    return table.to_json(orient='split', index=False, force_ascii=False).encode('utf-8')
+
+
+class QueryService:
+    # Service partagé par toutes les sessions : jeu actif publié par l'application, résultats encodés conservés
+    # dans le cache des résultats, calculs identiques simultanés regroupés en un seul
+    def __init__(self, registry, cache, workers=QUERY_API_WORKERS):
+        self.registry = registry
+        self.cache = cache
+        self.server = None
+        self.error = None
+        self.stats = {'requests': 0, 'not_modified': 0, 'cached': 0, 'computed': 0, 'errors': 0}
+        self._active = None
+        self._slots = threading.BoundedSemaphore(max(1, workers))
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        if self.server is None:
+            return None
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # Démarrage du serveur HTTP dans un thread (un thread par connexion)
+    def start(self, host=QUERY_API_HOST, port=QUERY_API_PORT):
+        handler = type('Handler', (QueryHandler,), {'service': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='query-api', daemon=True).start()
+        return self
+
+    # Jeu de données servi par défaut : le dernier activé dans l'application (référence seulement, le registre
+    # reste seul à décider de ce qui reste en mémoire)
+    def publish(self, dataset):
+        self._active = (dataset.key, dataset.name)
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    # Jeu de données interrogé : jeu stocké nommé, sinon jeu publié, sinon jeu actif du stock
+    def dataset(self, name=None):
+        if name is None and self._active is not None:
+            dataset = self.registry.get_or_load(*self._active)
+            if dataset is not None:
+                return dataset
+        name = name or store.get_active()
+        if name is None or name not in {meta['name'] for meta in store.list_datasets()}:
+            raise QueryError(f"Jeu de données introuvable : {name}" if name else "Aucun jeu de données actif", 404)
+        dataset = self.registry.get_or_load(store.dataset_key(store.read_meta(name)), name)
+        if dataset is None:
+            raise QueryError(f"Jeu de données non rechargeable : {name}", 404)
+        return dataset
+
+    # Réponse d'une requête : (corps, lignes au total), depuis le cache ou calculée une seule fois
+    def payload(self, dataset, query):
+        key = (dataset.key, 'query_api', query['format'], tuple(query['measures']), tuple(query['by']),
+               query['limit'], canonical_filters(query['filters']))
+        value = self.cache.get(key)
+        if value is not None:
+            self.count('cached')
+            return value
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            self.count('cached')
+            return future.result()
+        try:
+            with self._slots:
+                def compute():
+                    table, total = run_query(dataset, query)
+                    return encode_table(table, query['format']), total
+                value = self.cache.get_or_compute(key, compute)
+            self.count('computed')
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    service = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.service.count('requests')
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        try:
+            name = params.pop('dataset', [None])[-1]
+            if url.path == '/health':
+                self.health(self.service.dataset(name))
+            elif url.path == '/query':
+                self.query(self.service.dataset(name), parse_query(params))
+            else:
+                raise QueryError(f"Chemin inconnu : {url.path}", 404)
+        except QueryError as e:
+            self.service.count('errors')
+            self.send_json({'error': str(e)}, e.status)
+        except Exception as e:
+            self.service.count('errors')
+            self.send_json({'error': f"Erreur lors du calcul : {e}"}, 500)
+
+    def health(self, dataset):
+        self.send_json({
+            'dataset': dataset.name,
+            'key': dataset.key,
+            'rows': dataset.rows,
+            'dimensions': list(KEY_COLUMNS),
+            'measures': list(MEASURES),
+            'formats': list(QUERY_FORMATS),
+        })
+
+    def query(self, dataset, query):
+        etag = query_etag(dataset.key, query)
+        # Requête conditionnelle : le client a déjà ce résultat pour cette version du jeu
+        if etag in [tag.strip().removeprefix('W/') for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.service.count('not_modified')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            return
+        body, total = self.service.payload(dataset, query)
+        self.send_body(body, QUERY_FORMATS[query['format']], {
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+            'X-Dataset': dataset.name or dataset.key[:12],
+            'X-Total-Rows': str(total),
+        })
+
+    def send_json(self, value, status=200):
+        self.send_body(json.dumps(value, ensure_ascii=False).encode('utf-8'), QUERY_FORMATS['json'], status=status)
+
+    def send_body(self, body, content_type, headers=None, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type + ('; charset=utf-8' if content_type.endswith('json') else ''))
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Pas de journal par requête dans la console du serveur Streamlit
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+
+import snapshot
+import store
+from approx import build_approx
+from catalog import build_catalog
+from customer_report import LabelIndex
+from cube import build_cube
+from star_schema import build_star_schema
+
+
+class Dataset:
+    # Jeu de données immuable partagé entre les sessions : schéma en étoile, cube et catalogue des dimensions
+    def __init__(self, key, star, cube, name=None, catalog=None, profile=None, approx=None):
+        self.key = key
+        self.name = name
+        self.star = star
+        self.cube = cube
+        self.catalog = catalog if catalog is not None else build_catalog(star)
+        # Profil des colonnes calculé à la lecture (None pour un jeu stocké avant les profils)
+        self.profile = profile
+        # Esquisses du mode approché, construites avec le cube
+        self.approx = approx if approx is not None else build_approx(cube)
+        self.size_bytes = star.memory_usage() + cube.memory_usage() + self.approx.memory_usage()
+        self._label_indexes = {}
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+        # Vrai pour un jeu agrégé en flux : cube et dimensions seulement, sans table de faits
+        self.streamed = False
+        # Origine et durée du chargement depuis le disque (None pour un jeu construit en mémoire)
+        self.load_report = None
+
+    # Nombre de lignes sources (lu sur le cuboïde total, présent même sans table de faits)
+    @property
+    def rows(self):
+        return int(self.cube.cuboids[()]['Transactions'].sum())
+
+    # Index des libellés d'une dimension, construit à la première recherche ou au premier tri par libellé
+    def label_index(self, dim):
+        index = self._label_indexes.get(dim)
+        if index is None:
+            index = self._label_indexes[dim] = LabelIndex(self.star.dims[dim][dim].to_numpy())
+            self.size_bytes += index.memory_usage()
+        return index
+
+
+# Fonction pour construire un jeu de données à partir d'un DataFrame compact
+def build_dataset(df, key, name=None, profile=None):
+    star = build_star_schema(df)
+    return Dataset(key, star, build_cube(star), name, profile=profile)
+
+
+class DatasetRegistry:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._entries.values())
+
+    # Jeu de données résident, marqué comme récemment utilisé
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.last_used = time.time()
+                entry.hits += 1
+            return entry
+
+    # Jeu de données résident ou rechargé depuis le stock (dernière version du jeu nommé)
+    def get_or_load(self, key, name=None):
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        name = store.find_dataset(key) or name
+        if name is None or name not in {meta['name'] for meta in store.list_datasets()}:
+            return None
+        meta = store.read_meta(name)
+        stored_key = store.dataset_key(meta)
+        entry = self.get(stored_key)
+        if entry is None:
+            start = time.perf_counter()
+            # Instantané du jeu s'il est à jour, sinon relecture du stock et reconstruction (instantané écrit ensuite)
+            parts = snapshot.load_snapshot(name, stored_key)
+            if parts is None and meta.get('streamed'):
+                # Jeu agrégé en flux : sans table de faits stockée, seul son instantané permet de le recharger
+                return None
+            if parts is not None:
+                entry = Dataset(stored_key, parts['star'], parts['cube'], name, catalog=parts['catalog'],
+                                profile=store.load_profile(name), approx=parts['approx'])
+                entry.streamed = parts['streamed']
+                entry.load_report = {'source': 'instantané', 'seconds': time.perf_counter() - start}
+            else:
+                entry = build_dataset(store.load_dataset(name), stored_key, name, store.load_profile(name))
+                entry.load_report = {'source': 'stock', 'seconds': time.perf_counter() - start}
+                snapshot.save_snapshot_async(name, entry)
+            entry = self.put(entry)
+        return entry
+
+    # Enregistrement d'un jeu de données, puis éviction LRU si le plafond est dépassé
+    def put(self, entry):
+        with self._lock:
+            existing = self._entries.get(entry.key)
+            if existing is not None:
+                if entry.name and not existing.name:
+                    existing.name = entry.name
+                return self.get(entry.key)
+            self._entries[entry.key] = entry
+            self._evict(keep=entry.key)
+            return entry
+
+    def _evict(self, keep):
+        while self.total_bytes > self.max_bytes:
+            victims = [key for key in self._entries if key != keep]
+            if not victims:
+                break
+            self._spill(self._entries.pop(victims[0]))
+
+    # Un jeu non sauvegardé est déversé dans le stock pour pouvoir être rechargé ; un jeu agrégé en flux est
+    # enregistré dès l'agrégation (métadonnées et instantané), il n'a rien à déverser
+    def _spill(self, entry):
+        if entry.name is None and not entry.streamed:
+            entry.name = f"upload_{entry.key[:12]}"
+            store.save_dataset(entry.star.to_frame(), entry.name, source='registre', batch_hash=entry.key)
+
+    # Retrait explicite d'un jeu de données de la mémoire
+    def evict(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._spill(entry)
+        return entry
+
+    # Description des jeux de données résidents, du plus récemment utilisé au plus ancien
+    def resident(self):
+        with self._lock:
+            entries = list(reversed(self._entries.values()))
+        return [{
+            'key': entry.key,
+            'name': entry.name or '(non sauvegardé)',
+            'rows': entry.rows,
+            'size_bytes': entry.size_bytes,
+            'hits': entry.hits,
+            'loaded_at': time.strftime('%H:%M:%S', time.localtime(entry.loaded_at)),
+            'last_used': time.strftime('%H:%M:%S', time.localtime(entry.last_used)),
+        } for entry in entries]
@@ -0,0 +1,114 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Fonction pour canoniser des filtres : l'ordre des dimensions et des valeurs est ignoré
+def canonical_filters(filters):
+    return frozenset(
+        (dim, frozenset(labels)) for dim, labels in filters.items() if labels is not None
+    )
+
+
+# Fonction pour estimer la taille en mémoire d'un résultat
+def result_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(result_size(k) + result_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(result_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+# Fonction pour décomposer un résultat en objets comptés séparément : les éléments d'un tuple (par exemple un résultat
+# et son temps de calcul) peuvent être déjà en cache sous leur propre clé
+def result_parts(value):
+    return list(value) if isinstance(value, tuple) else [value]
+
+
+class ResultCache:
+    # Cache LRU des résultats dérivés, borné en octets ; les résultats sont partagés et ne doivent pas être modifiés.
+    # Un même objet rangé sous plusieurs clés (résultat d'un panneau déjà en cache) n'est compté qu'une fois.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Objets en cache : id -> [objet, taille, nombre d'entrées qui le contiennent]
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    # Résultat en cache ou None, sans calcul (l'absence est comptée par get_or_compute)
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = compute()
+        parts = result_parts(value)
+        sizes = [result_size(part) for part in parts]
+        if sum(sizes) > self.max_bytes:
+            return value
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, [id(part) for part in parts])
+                for part, size in zip(parts, sizes):
+                    self._hold(part, size)
+            while self.total_bytes > self.max_bytes:
+                _, (_, ids) = self._entries.popitem(last=False)
+                for part_id in ids:
+                    self._release(part_id)
+                self.evictions += 1
+        return value
+
+    # Comptage d'un objet rangé dans une entrée ; sa taille n'est ajoutée qu'à sa première entrée
+    def _hold(self, part, size):
+        held = self._objects.get(id(part))
+        if held is None:
+            self._objects[id(part)] = [part, size, 1]
+            self.total_bytes += size
+        else:
+            held[2] += 1
+
+    # Libération d'un objet par une entrée évincée ; sa taille n'est retirée qu'avec sa dernière entrée
+    def _release(self, part_id):
+        held = self._objects[part_id]
+        held[2] -= 1
+        if held[2] == 0:
+            del self._objects[part_id]
+            self.total_bytes -= held[1]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+# Précision des HyperLogLog : 2**12 registres, erreur relative type ≈ 1,6 %
+HLL_PRECISION = 12
+
+
+# Fonction pour calculer l'empreinte 64 bits de valeurs (identique d'un bloc à l'autre pour une même valeur)
+def hash_values(values):
+    return pd.util.hash_array(np.asarray(values))
+
+
+# Fonction pour répartir des empreintes entre les registres d'un HyperLogLog : (registre, rang du premier bit à 1)
+def hll_ranks(hashes, precision=HLL_PRECISION):
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    nonzero = rest > 0
+    rank = np.full(len(hashes), 64 - precision + 1, dtype=np.uint8)
+    rank[nonzero] = (64 - precision - np.floor(np.log2(rest[nonzero].astype(np.float64)))).astype(np.uint8)
+    return index, rank
+
+
+# Fonction pour estimer une cardinalité à partir de registres HyperLogLog
+def hll_estimate(registers):
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Petites cardinalités : comptage linéaire des registres vides
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+# Erreur relative type d'un HyperLogLog à m registres
+def hll_error(m):
+    return 1.04 / np.sqrt(m)
+
+
+class HyperLogLog:
+    # Estimation du nombre de valeurs distinctes en mémoire constante ; fusionnable (max des registres)
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        if len(hashes) == 0:
+            return
+        index, rank = hll_ranks(hashes, self.precision)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, values):
+        self.add_hashes(hash_values(values))
+
+    def merge(self, other):
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        return hll_estimate(self.registers)
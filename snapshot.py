@@ -0,0 +1,151 @@
+import json
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+import store
+from approx import ApproxSketches
+from catalog import DimensionCatalog
+from cube import Cube
+from filter_index import FilterIndex
+from star_schema import StarSchema
+
+# Instantané d'un jeu de données stocké : schéma en étoile, cuboïdes, catalogue, esquisses et index déjà construits,
+# pour redémarrer sans relire ni réagréger les faits. Il est rangé avec le jeu et n'est valable que pour sa clé.
+SNAPSHOT_DIR = 'snapshot'
+MANIFEST_FILE = 'manifest.json'
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def snapshot_dir(name):
+    return store.dataset_dir(name) / SNAPSHOT_DIR
+
+
+# Fonctions pour écrire et relire un DataFrame (index et types compris) au format Arrow IPC
+def write_frame(df, path):
+    store.write_table(pa.Table.from_pandas(df, preserve_index=True), path)
+
+
+def read_frame(path):
+    return ipc.open_file(pa.memory_map(str(path), 'r')).read_all().to_pandas()
+
+
+# Fonction pour lire le manifeste de l'instantané d'un jeu de données (None s'il n'y en a pas)
+def read_manifest(name):
+    path = snapshot_dir(name) / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Vrai si l'instantané du jeu correspond à la version stockée (clé de contenu)
+def has_snapshot(name, key):
+    manifest = read_manifest(name)
+    return manifest is not None and manifest['key'] == key
+
+
+# Fonction pour écrire l'instantané d'un jeu de données, dans un répertoire temporaire remplacé ensuite
+def save_snapshot(name, dataset):
+    start = time.perf_counter()
+    tmp_path = store.dataset_dir(name) / f".{SNAPSHOT_DIR}.tmp"
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    star, cube = dataset.star, dataset.cube
+    # Index des cuboïdes construits d'avance (hors du chemin critique) pour être repris au redémarrage
+    for dims in cube.cuboids:
+        if dims:
+            cube.filter_index(dims)
+    write_frame(star.fact, tmp_path / 'fact.arrow')
+    for dim, table in star.dims.items():
+        write_frame(table, tmp_path / f"dim-{dim}.arrow")
+    cuboids = []
+    for i, (dims, table) in enumerate(cube.cuboids.items()):
+        write_frame(table, tmp_path / f"cuboid-{i}.arrow")
+        cuboids.append(list(dims))
+    for dim, entry in dataset.catalog.entries.items():
+        write_frame(entry, tmp_path / f"catalog-{dim}.arrow")
+    approx = dataset.approx
+    write_frame(approx.cells, tmp_path / 'approx-cells.arrow')
+    write_frame(approx.products, tmp_path / 'approx-products.arrow')
+    # Index pays/mois des cuboïdes déjà construits (listes de lignes par valeur)
+    arrays = {'approx.registers': approx.registers, 'approx.errors': approx.errors}
+    indexes = []
+    for dims, index in list(cube._indexes.items()):
+        position = cuboids.index(list(dims))
+        for dim, (order, offsets) in index.postings.items():
+            arrays[f"index-{position}.{dim}.order"] = order
+            arrays[f"index-{position}.{dim}.offsets"] = offsets
+        indexes.append({'cuboid': position, 'size': index.size, 'dims': list(index.postings)})
+    with open(tmp_path / 'arrays.npz', 'wb') as f:
+        np.savez(f, **arrays)
+
+    manifest = {
+        'key': dataset.key,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'streamed': dataset.streamed,
+        'dims': list(star.dims),
+        'cuboids': cuboids,
+        'catalog': list(dataset.catalog.entries),
+        'indexes': indexes,
+        'approx': {'precision': approx.precision, 'k': approx.k},
+        'seconds': time.perf_counter() - start,
+    }
+    with open(tmp_path / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    path = snapshot_dir(name)
+    if path.exists():
+        shutil.rmtree(path)
+    tmp_path.rename(path)
+    return manifest
+
+
+# Fonction pour programmer l'écriture de l'instantané en arrière-plan (une seule à la fois par jeu)
+def save_snapshot_async(name, dataset):
+    with _pending_lock:
+        if name in _pending or has_snapshot(name, dataset.key):
+            return None
+        _pending.add(name)
+
+    def write():
+        try:
+            # Le jeu a pu être remplacé dans le stock entre-temps : seule la version stockée est instantanée
+            if store.dataset_key(store.read_meta(name)) == dataset.key:
+                return save_snapshot(name, dataset)
+        finally:
+            with _pending_lock:
+                _pending.discard(name)
+    return _writer.submit(write)
+
+
+# Fonction pour restaurer les composants d'un jeu de données depuis son instantané ; None si absent ou périmé
+def load_snapshot(name, key):
+    manifest = read_manifest(name)
+    if manifest is None or manifest['key'] != key:
+        return None
+    path = snapshot_dir(name)
+    dims = {dim: read_frame(path / f"dim-{dim}.arrow") for dim in manifest['dims']}
+    star = StarSchema(read_frame(path / 'fact.arrow'), dims)
+    cuboids = {tuple(dims): read_frame(path / f"cuboid-{i}.arrow") for i, dims in enumerate(manifest['cuboids'])}
+    cube = Cube(star, cuboids)
+    catalog = DimensionCatalog({dim: read_frame(path / f"catalog-{dim}.arrow") for dim in manifest['catalog']})
+    with np.load(path / 'arrays.npz') as arrays:
+        for index in manifest['indexes']:
+            position = index['cuboid']
+            postings = {dim: (arrays[f"index-{position}.{dim}.order"], arrays[f"index-{position}.{dim}.offsets"])
+                        for dim in index['dims']}
+            cube._indexes[tuple(manifest['cuboids'][position])] = FilterIndex.from_postings(index['size'], postings)
+        approx = ApproxSketches(read_frame(path / 'approx-cells.arrow'), arrays['approx.registers'],
+                                read_frame(path / 'approx-products.arrow'), arrays['approx.errors'],
+                                manifest['approx']['precision'], manifest['approx']['k'])
+    return {'star': star, 'cube': cube, 'catalog': catalog, 'approx': approx, 'streamed': manifest['streamed']}
@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+from filter_index import INDEXED_DIMS, FilterIndex
+from ingest import MEASURE_COLUMNS, MONTHS
+
+# Clé de substitution de chaque dimension dans la table de faits
+KEY_COLUMNS = {
+    'Country': 'CountryKey',
+    'Month': 'MonthKey',
+    'CustomerID': 'CustomerKey',
+    'ProductName': 'ProductKey',
+}
+
+
+class StarSchema:
+    def __init__(self, fact, dims):
+        # fact : clés entières + mesures (ou liste de parties) ; dims : {dimension: table indexée par sa clé}
+        self._fact_parts = list(fact) if isinstance(fact, list) else [fact]
+        self.dims = dims
+        self._filter_index = None
+
+    # Table de faits ; les lots ajoutés ne sont concaténés qu'à la première lecture
+    @property
+    def fact(self):
+        if len(self._fact_parts) > 1:
+            self._fact_parts = [pd.concat(self._fact_parts, ignore_index=True)]
+        return self._fact_parts[0]
+
+    def __len__(self):
+        return sum(len(part) for part in self._fact_parts)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    # Traduction de libellés en clés (les libellés inconnus sont ignorés)
+    def keys_for(self, dim, labels):
+        keys = pd.Index(self.dims[dim][dim]).get_indexer(list(labels))
+        return keys[keys >= 0]
+
+    # Index des lignes de faits par pays et par mois, construit à la première utilisation
+    @property
+    def filter_index(self):
+        if self._filter_index is None:
+            self._filter_index = build_filter_index(self.fact)
+        return self._filter_index
+
+    # Identifiants des lignes de faits correspondant aux filtres (None : toutes les lignes)
+    def filter_rows(self, **filters):
+        return select_rows(self.fact, self.filter_index, self, filters)
+
+    # Ajout des libellés des dimensions à un résultat agrégé sur les clés
+    def label(self, df):
+        df = df.copy()
+        for dim, key in KEY_COLUMNS.items():
+            if key not in df.columns:
+                continue
+            position = df.columns.get_loc(key)
+            keys = df.pop(key).to_numpy()
+            table = self.dims[dim]
+            for offset, col in enumerate(table.columns):
+                df.insert(position + offset, col, table[col].reindex(keys).to_numpy())
+        return df
+
+    # Agrégation des mesures sur les clés entières, libellés joints ensuite
+    def aggregate(self, dims, measures):
+        keys = [KEY_COLUMNS[dim] for dim in dims]
+        agg = self.fact.groupby(keys, sort=False)[measures].sum().reset_index()
+        agg = agg[(agg[keys] >= 0).all(axis=1)]
+        return self.label(agg)
+
+    # Nouvelle version avec un lot en plus : les faits existants sont partagés sans copie
+    def with_batch(self, df):
+        dims, batch = encode_batch(self.dims, df)
+        return StarSchema(self._fact_parts + [batch], dims), batch
+
+    # Reconstitution des premières lignes dénormalisées, pour les aperçus
+    def head(self, n=5):
+        return self.label(self.fact.head(n))
+
+    # Reconstitution du DataFrame compact (dimensions en catégories, sans copie des libellés)
+    def to_frame(self):
+        fact = self.fact
+        df = pd.DataFrame(index=pd.RangeIndex(len(fact)))
+        for dim, key in KEY_COLUMNS.items():
+            df[dim] = pd.Categorical.from_codes(fact[key].to_numpy(), categories=self.dims[dim][dim])
+        for col in MEASURE_COLUMNS:
+            df[col] = fact[col].to_numpy()
+        if 'MonthOrder' in self.dims['Month'].columns:
+            orders = self.dims['Month']['MonthOrder'].reindex(fact['MonthKey'].to_numpy()).to_numpy()
+            df['MonthOrder'] = pd.to_numeric(orders, downcast='integer')
+        return df
+
+    def memory_usage(self):
+        total = sum(part.memory_usage(deep=True).sum() for part in self._fact_parts)
+        total += sum(table.memory_usage(deep=True).sum() for table in self.dims.values())
+        return int(total)
+
+
+# Fonction pour encoder un lot avec les clés des dimensions : les nouvelles valeurs reçoivent
+# de nouvelles clés, les clés existantes ne changent pas
+def encode_batch(dims, df):
+    dims = dict(dims)
+    batch = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    for dim, key in KEY_COLUMNS.items():
+        column = df[dim]
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype('category')
+        categories = column.cat.categories
+        table = dims[dim]
+        index = pd.Index(table[dim])
+        new_labels = categories[index.get_indexer(categories) < 0]
+        if len(new_labels):
+            start = len(table)
+            added = pd.DataFrame({dim: new_labels}, index=pd.RangeIndex(start, start + len(new_labels), name=key))
+            if 'MonthOrder' in table.columns:
+                added['MonthOrder'] = new_month_orders(new_labels, table['MonthOrder'])
+            table = pd.concat([table, added]) if len(table) else added
+            dims[dim] = table
+            index = pd.Index(table[dim])
+        codes = column.cat.codes.to_numpy()
+        keys = np.full(len(codes), -1)
+        if len(categories):
+            keys = np.where(codes >= 0, index.get_indexer(categories)[codes], -1)
+        batch[key] = pd.to_numeric(keys, downcast='integer')
+    for col in MEASURE_COLUMNS:
+        batch[col] = df[col].to_numpy()
+    return dims, batch
+
+
+# Fonction pour créer un schéma en étoile vide (dimensions sans valeurs, aucun fait)
+def empty_star():
+    dims = {}
+    for dim, key in KEY_COLUMNS.items():
+        table = pd.DataFrame({dim: pd.Series([], dtype=object)}, index=pd.RangeIndex(0, name=key))
+        if dim == 'Month':
+            table['MonthOrder'] = pd.Series([], dtype='int64')
+        dims[dim] = table
+    fact = pd.DataFrame({key: pd.Series([], dtype='int8') for key in KEY_COLUMNS.values()})
+    for col in MEASURE_COLUMNS:
+        fact[col] = pd.Series([], dtype='float64')
+    return StarSchema(fact, dims)
+
+
+# Fonction pour indexer les clés pays et mois d'une table de faits ou d'un cuboïde
+def build_filter_index(table):
+    return FilterIndex(table, {dim: KEY_COLUMNS[dim] for dim in INDEXED_DIMS})
+
+
+# Fonction pour résoudre des filtres (libellés) en identifiants de lignes d'une table indexée ;
+# les dimensions non indexées sont filtrées par isin sur les seules lignes retenues
+def select_rows(table, index, star, filters):
+    filters = {dim: labels for dim, labels in filters.items() if labels is not None}
+    indexed = {dim: star.keys_for(dim, labels) for dim, labels in filters.items() if dim in index}
+    rows = index.select(indexed)
+    for dim, labels in filters.items():
+        if dim in index:
+            continue
+        keys = table[KEY_COLUMNS[dim]].to_numpy()
+        if rows is not None:
+            rows = rows[np.isin(keys[rows], star.keys_for(dim, labels))]
+        else:
+            rows = np.flatnonzero(np.isin(keys, star.keys_for(dim, labels)))
+    return rows
+
+
+# Fonction pour ordonner les nouveaux mois d'un lot après les mois connus
+def new_month_orders(labels, existing_orders):
+    next_order = int(existing_orders.max()) + 1 if len(existing_orders) else 0
+    orders = []
+    for label in labels:
+        if label in MONTHS:
+            orders.append(MONTHS.index(label))
+        else:
+            orders.append(next_order)
+            next_order += 1
+    return orders
+
+
+# Fonction pour construire le schéma en étoile à partir d'un DataFrame compact
+def build_star_schema(df):
+    fact = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    dims = {}
+    for dim, key in KEY_COLUMNS.items():
+        column = df[dim]
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype('category')
+        codes = column.cat.codes
+        fact[key] = codes.to_numpy()
+        table = pd.DataFrame({dim: column.cat.categories}, index=pd.RangeIndex(len(column.cat.categories), name=key))
+        if dim == 'Month' and 'MonthOrder' in df.columns:
+            # Attribut MonthOrder porté par la dimension mois
+            order = pd.Series(df['MonthOrder'].to_numpy()).groupby(codes.to_numpy()).first()
+            table['MonthOrder'] = order.reindex(table.index).to_numpy()
+        dims[dim] = table
+    for col in MEASURE_COLUMNS:
+        fact[col] = df[col].to_numpy()
+    return StarSchema(fact, dims)
@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from ingest import concat_compact_frames
+from profiling import DatasetProfile
+
+# Répertoire du stock de données colonnaire (fichiers Arrow IPC, lisibles par memory-map)
+STORE_DIR = Path('data_store')
+META_FILE = 'meta.json'
+PROFILE_FILE = 'profile.npz'
+ACTIVE_FILE = 'active'
+
+# Verrous par jeu de données : les ajouts de lots et les remplacements d'un même jeu se font l'un après l'autre
+# (sessions d'un même processus serveur)
+_dataset_locks = {}
+_dataset_locks_lock = threading.Lock()
+
+
+# Fonction pour dériver un nom de jeu de données à partir d'un nom de fichier
+def dataset_name(filename):
+    stem = Path(filename).stem
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', stem).strip('_') or 'dataset'
+
+
+def dataset_dir(name):
+    return STORE_DIR / name
+
+
+class SchemaMismatchError(ValueError):
+    pass
+
+
+class DuplicateBatchError(ValueError):
+    pass
+
+
+# Fonction pour obtenir le verrou d'un jeu de données
+def dataset_lock(name):
+    with _dataset_locks_lock:
+        return _dataset_locks.setdefault(name, threading.RLock())
+
+
+# Fonction pour calculer l'empreinte du contenu d'un fichier (octets ou chemin)
+def content_hash(source):
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+# Fonction pour écrire une table Arrow au format IPC (non compressé, donc mappable sans copie)
+def write_table(table, path):
+    with pa.OSFile(str(path), 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+# Fonction pour décrire le schéma d'une table Arrow
+def describe_schema(schema):
+    return {field.name: str(field.type) for field in schema if field.name != '__index_level_0__'}
+
+
+# Fonction pour écrire les métadonnées de façon atomique
+def write_meta(path, meta):
+    tmp_file = path / f".{META_FILE}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path / META_FILE)
+
+
+# Fonction pour créer le répertoire d'écriture d'une nouvelle version, propre à cet enregistrement :
+# deux sessions peuvent enregistrer le même nom en même temps
+def staging_dir(name):
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=f".{name}.", suffix='.tmp', dir=STORE_DIR))
+
+
+# Fonction pour mettre en place une nouvelle version écrite dans staging_dir. L'ancienne version est d'abord
+# mise de côté par renommage, puis la nouvelle prend sa place, et l'ancienne n'est supprimée qu'ensuite :
+# un arrêt entre les deux renommages laisse l'ancienne version intacte dans .<nom>.old-<id>, jamais aucune version.
+def install(tmp_path, name):
+    with dataset_lock(name):
+        path = dataset_dir(name)
+        asides = []
+        while True:
+            aside = STORE_DIR / f".{name}.old-{uuid.uuid4().hex}"
+            try:
+                path.rename(aside)
+                asides.append(aside)
+            except FileNotFoundError:
+                pass
+            try:
+                tmp_path.rename(path)
+                break
+            except OSError:
+                # Une autre session vient d'installer sa version : elle est mise de côté à son tour
+                if not path.exists():
+                    raise
+        for aside in asides:
+            shutil.rmtree(aside, ignore_errors=True)
+
+
+# Fonction pour enregistrer un jeu agrégé en flux : sans table de faits, seules les métadonnées sont stockées ici,
+# le cube étant conservé dans l'instantané du jeu (snapshot.py) ; la clé du jeu sert d'unique lot
+def save_streamed(name, key, rows, source=None, profile=None):
+    tmp_path = staging_dir(name)
+    meta = {
+        'name': name,
+        'source': source,
+        'rows': rows,
+        'columns': {},
+        'parts': [],
+        'size_bytes': 0,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'batches': [key],
+        'streamed': True,
+    }
+    if profile is not None:
+        profile.save(tmp_path / PROFILE_FILE)
+        meta['profile'] = profile.summary()
+    write_meta(tmp_path, meta)
+    install(tmp_path, name)
+    return meta
+
+
+# Fonction pour enregistrer un DataFrame comme jeu de données du stock, avec le profil de ses colonnes
+def save_dataset(df, name, source=None, batch_hash=None, profile=None):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = staging_dir(name)
+
+    part = 'part-00000.arrow'
+    write_table(table, tmp_path / part)
+    meta = {
+        'name': name,
+        'source': source,
+        'rows': table.num_rows,
+        'columns': describe_schema(table.schema),
+        'parts': [part],
+        'size_bytes': (tmp_path / part).stat().st_size,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'batches': [batch_hash] if batch_hash else [],
+    }
+    if profile is not None:
+        profile.save(tmp_path / PROFILE_FILE)
+        meta['profile'] = profile.summary()
+    write_meta(tmp_path, meta)
+
+    install(tmp_path, name)
+    return meta
+
+
+# Fonction pour lire les métadonnées d'un jeu de données sans lire les données
+def read_meta(name):
+    with open(dataset_dir(name) / META_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Fonction pour lister les jeux de données stockés à partir de leurs métadonnées
+def list_datasets():
+    if not STORE_DIR.exists():
+        return []
+    datasets = []
+    for path in sorted(STORE_DIR.iterdir()):
+        # Répertoires cachés : enregistrements en cours ou versions mises de côté
+        if path.is_dir() and not path.name.startswith('.') and (path / META_FILE).exists():
+            datasets.append(read_meta(path.name))
+    return datasets
+
+
+# Fonction pour retrouver le jeu stocké tel quel depuis un fichier source, sans relire le fichier : même source,
+# un seul lot, enregistré après la dernière modification du fichier (None sinon)
+def find_source(path):
+    modified = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(path)))
+    for meta in list_datasets():
+        if meta.get('source') == path and len(meta.get('batches') or []) <= 1 and meta['created'] >= modified:
+            return meta
+    return None
+
+
+# Fonction pour ouvrir les parties d'un jeu de données comme tables Arrow mappées en mémoire
+def load_tables(name, columns=None):
+    meta = read_meta(name)
+    tables = []
+    for part in meta['parts']:
+        source = pa.memory_map(str(dataset_dir(name) / part), 'r')
+        table = ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        tables.append(table)
+    return tables
+
+
+# Fonction pour charger un jeu de données ; seules les colonnes demandées sont lues
+def load_dataset(name, columns=None):
+    # Chaque lot ajouté a son propre dictionnaire : les catégories sont unifiées à la lecture
+    frames = [table.to_pandas(split_blocks=True) for table in load_tables(name, columns)]
+    return concat_compact_frames(frames)
+
+
+# Fonction pour classer un type Arrow : dimension (texte) ou mesure (numérique)
+def column_kind(arrow_type):
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type):
+        return 'numeric'
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return 'text'
+    return str(arrow_type)
+
+
+# Fonction pour vérifier qu'un lot a le même schéma que le jeu de données stocké
+def validate_batch(name, table):
+    meta = read_meta(name)
+    reader = ipc.open_file(pa.memory_map(str(dataset_dir(name) / meta['parts'][0]), 'r'))
+    expected = {field.name: column_kind(field.type) for field in reader.schema}
+    received = {field.name: column_kind(field.type) for field in table.schema}
+    missing = [col for col in expected if col not in received]
+    extra = [col for col in received if col not in expected]
+    mismatched = [col for col in expected if col in received and expected[col] != received[col]]
+    problems = []
+    if missing:
+        problems.append(f"colonnes manquantes : {', '.join(missing)}")
+    if extra:
+        problems.append(f"colonnes en trop : {', '.join(extra)}")
+    if mismatched:
+        problems.append(f"types différents : {', '.join(mismatched)}")
+    if problems:
+        raise SchemaMismatchError("; ".join(problems))
+    return table.select(list(expected))
+
+
+# Fonction pour ajouter un lot à un jeu de données (une nouvelle partie, l'historique n'est pas réécrit) ;
+# le profil du lot est fusionné dans celui du jeu de données. Sous le verrou du jeu : un lot déjà présent est refusé
+# (DuplicateBatchError), la partie est écrite à part puis renommée, et les métadonnées ne la référencent qu'ensuite.
+def append_dataset(name, df, batch_hash=None, profile=None):
+    with dataset_lock(name):
+        meta = read_meta(name)
+        if batch_hash and batch_hash in meta.get('batches', []):
+            raise DuplicateBatchError(f"lot déjà présent dans {name}")
+        table = validate_batch(name, pa.Table.from_pandas(df, preserve_index=False))
+        path = dataset_dir(name)
+        part = f"part-{len(meta['parts']):05d}.arrow"
+        write_table(table, path / f".{part}.tmp")
+        os.replace(path / f".{part}.tmp", path / part)
+        meta['parts'].append(part)
+        meta['rows'] += table.num_rows
+        meta['size_bytes'] += (path / part).stat().st_size
+        meta['updated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        if batch_hash:
+            meta.setdefault('batches', []).append(batch_hash)
+        previous = load_profile(name)
+        if previous is not None and profile is not None:
+            merged = previous.merge(profile)
+            merged.save(path / f".{PROFILE_FILE}.tmp")
+            os.replace(path / f".{PROFILE_FILE}.tmp", path / PROFILE_FILE)
+            meta['profile'] = merged.summary()
+        else:
+            # Profil inconnu pour une partie des lignes : il n'est plus affiché
+            (path / PROFILE_FILE).unlink(missing_ok=True)
+            meta.pop('profile', None)
+        write_meta(path, meta)
+        return meta
+
+
+# Fonction pour calculer la clé de contenu d'un jeu de données à partir de ses lots
+def dataset_key(meta):
+    batches = meta.get('batches') or []
+    if len(batches) == 1:
+        return batches[0]
+    if not batches:
+        # Jeu de données sans empreinte de fichier : clé dérivée de son nom et de sa date
+        batches = [meta['name'], meta['created']]
+    return hashlib.sha256('|'.join(batches).encode()).hexdigest()
+
+
+# Fonction pour retrouver le jeu de données stocké ayant une clé de contenu donnée
+def find_dataset(key):
+    for meta in list_datasets():
+        if dataset_key(meta) == key:
+            return meta['name']
+    return None
+
+
+# Fonction pour savoir si un lot a déjà été intégré au jeu de données
+def has_batch(name, batch_hash):
+    return batch_hash in read_meta(name).get('batches', [])
+
+
+# Fonction pour charger le profil des colonnes d'un jeu de données (None s'il n'a pas été calculé)
+def load_profile(name):
+    path = dataset_dir(name) / PROFILE_FILE
+    return DatasetProfile.load(path) if path.exists() else None
+
+
+# Fonction pour lire les n premières lignes d'un jeu de données
+def preview_dataset(name, n=5):
+    meta = read_meta(name)
+    reader = ipc.open_file(pa.memory_map(str(dataset_dir(name) / meta['parts'][0]), 'r'))
+    if reader.num_record_batches == 0:
+        return reader.schema.empty_table().to_pandas()
+    batch = reader.get_batch(0).slice(0, n)
+    return pa.Table.from_batches([batch]).to_pandas()
+
+
+# Fonctions pour mémoriser le jeu de données actif
+def set_active(name):
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    (STORE_DIR / ACTIVE_FILE).write_text(name, encoding='utf-8')
+
+
+def get_active():
+    path = STORE_DIR / ACTIVE_FILE
+    if not path.exists():
+        return None
+    name = path.read_text(encoding='utf-8').strip()
+    return name if (dataset_dir(name) / META_FILE).exists() else None
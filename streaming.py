@@ -0,0 +1,252 @@
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from approx import ApproxSketches
+from catalog import build_catalog
+from cube import CUBOIDS, Cube, rollup
+from ingest import MEASURE_COLUMNS, REQUIRED_COLUMNS, check_required_columns, compact_frame, iter_sales_chunks
+from profiling import DatasetProfile
+from registry import Dataset
+from star_schema import KEY_COLUMNS, StarSchema, empty_star, new_month_orders
+
+# Plafond mémoire de l'agrégation en flux (Mo). Un quart est réservé au bloc en cours et à ses copies (lecture,
+# encodage, agrégats du bloc : un bloc brut occupe au plus un seizième du plafond) ; le reste est partagé entre l'état
+# conservé (dimensions, cuboïdes, esquisses), les agrégats partiels en attente et la mémoire de leur fusion
+STREAM_MEMORY_MB = int(os.environ.get('VENTES_STREAM_MEMORY_MB', '512'))
+# Mémoire temporaire d'une agrégation (groupby), en multiple de la table agrégée (mesuré : 1,7 à 4,5 selon le nombre
+# de clés)
+ROLLUP_COPIES = 5
+# Part fixe hors état : tampons du lecteur CSV, profil du fichier et caches de pandas (mesurée : 3 à 4 Mo)
+FIXED_BYTES = 4 * 2**20
+SAMPLE_ROWS = 1000
+MIN_CHUNK_ROWS = 10_000
+
+# Cuboïdes calculés en flux : ceux du cube, plus le classement des produits sans filtre
+STREAM_CUBOIDS = CUBOIDS + [(('ProductName',), ('Country', 'Month', 'ProductName'))]
+# Cuboïdes nécessaires aux rapports et au tableau de bord, jamais abandonnés
+ESSENTIAL_CUBOIDS = {('Country', 'Month'), ('Country',), ('Month',), (), ('ProductName',)}
+
+
+# Fonction pour calculer la taille d'un bloc (en lignes) d'après un échantillon du fichier
+def chunk_rows_for(path, chunk_bytes):
+    sample = next(iter_sales_chunks(path, path.name, SAMPLE_ROWS, columns=REQUIRED_COLUMNS), None)
+    if sample is None or sample.empty:
+        return MIN_CHUNK_ROWS
+    row_bytes = sample.head(SAMPLE_ROWS).memory_usage(deep=True).sum() / min(len(sample), SAMPLE_ROWS)
+    return max(MIN_CHUNK_ROWS, int(chunk_bytes / row_bytes))
+
+
+# Fonction pour identifier un fichier source sans le relire (chemin, taille, date de modification)
+def stream_key(path):
+    stat = path.stat()
+    return 'stream-' + hashlib.sha256(f"{path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=False).sum())
+
+
+class DimensionKeys:
+    # Clés d'une dimension pendant l'agrégation en flux : la correspondance libellé → clé est conservée d'un bloc
+    # à l'autre et seules les valeurs nouvelles d'un bloc y sont ajoutées ; les lignes par clé sont cumulées pour
+    # le catalogue, construit une seule fois à la fin
+    def __init__(self, dim):
+        self.dim = dim
+        self.keys = {}
+        self.labels = []
+        self.orders = [] if dim == 'Month' else None
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.label_bytes = 0
+
+    # Clés des valeurs d'une colonne de bloc (-1 pour une valeur manquante)
+    def encode(self, column):
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype('category')
+        categories = column.cat.categories
+        lookup = np.fromiter((self.keys.get(label, -1) for label in categories), dtype=np.int64, count=len(categories))
+        new = lookup < 0
+        if new.any():
+            new_labels = categories[new].tolist()
+            start = len(self.labels)
+            lookup[new] = np.arange(start, start + len(new_labels))
+            self.keys.update(zip(new_labels, range(start, start + len(new_labels))))
+            if self.orders is not None:
+                self.orders.extend(new_month_orders(new_labels, np.asarray(self.orders)))
+            self.labels.extend(new_labels)
+            self.label_bytes += sum(sys.getsizeof(label) for label in new_labels)
+        codes = column.cat.codes.to_numpy()
+        keys = np.where(codes >= 0, lookup[codes], -1) if len(lookup) else np.full(len(codes), -1)
+        counts = np.bincount(keys[keys >= 0], minlength=len(self.labels))
+        counts[:len(self.counts)] += self.counts
+        self.counts = counts
+        return pd.to_numeric(keys, downcast='integer')
+
+    # Taille en mémoire : libellés, correspondance (avec ses clés, des entiers Python au-delà de 256) et comptes
+    def memory_usage(self):
+        mapping = sys.getsizeof(self.keys) + max(0, len(self.keys) - 257) * sys.getsizeof(2 ** 20)
+        return self.label_bytes + mapping + sys.getsizeof(self.labels) + self.counts.nbytes
+
+    # Correspondance libérée à la fin du flux, avant la construction des tables
+    def release(self):
+        self.keys = {}
+
+    # Table de la dimension, comme celle du schéma en étoile (clé en index)
+    def table(self):
+        table = pd.DataFrame({self.dim: pd.Series(self.labels, dtype=object)},
+                             index=pd.RangeIndex(len(self.labels), name=KEY_COLUMNS[self.dim]))
+        if self.orders is not None:
+            table['MonthOrder'] = pd.Series(self.orders, index=table.index, dtype='int64')
+        return table
+
+
+class StreamingAggregator:
+    # Agrégation bloc par bloc : seuls les dimensions et les cuboïdes restent en mémoire ;
+    # au-delà du plafond, les cuboïdes détaillés les plus volumineux sont abandonnés. peak_bytes estime le pic
+    # en comptant aussi les copies temporaires (bloc, encodage, agrégats du bloc, fusion, tables finales) ; il peut
+    # dépasser le plafond quand les dimensions, qui ne peuvent pas être abandonnées, n'y tiennent pas
+    def __init__(self, memory_limit):
+        self.memory_limit = memory_limit
+        self.dimensions = {dim: DimensionKeys(dim) for dim in KEY_COLUMNS}
+        self.profile = DatasetProfile()
+        self.approx = ApproxSketches()
+        empty = empty_star().fact.assign(Transactions=1)
+        self.cuboids = {dims: rollup(empty, [KEY_COLUMNS[dim] for dim in dims]) for dims, _ in STREAM_CUBOIDS}
+        self.pending = {dims: [] for dims in self.cuboids}
+        self.pending_bytes = 0
+        self.merged = False
+        self.state_bytes = 0
+        self.dims_bytes = 0
+        # Dernier bloc, gardé par la boucle de lecture jusqu'à la lecture du suivant
+        self.chunk_bytes = 0
+        self.peak_bytes = 0
+        self.peak_dims_bytes = 0
+        self.rows = 0
+        self.chunks = 0
+        self.dropped = []
+
+    @property
+    def resident_bytes(self):
+        return FIXED_BYTES + self.dims_bytes + self.state_bytes + self.pending_bytes + self.chunk_bytes
+
+    def track(self, transient_bytes=0):
+        self.peak_bytes = max(self.peak_bytes, self.resident_bytes + transient_bytes)
+        self.peak_dims_bytes = max(self.peak_dims_bytes, self.dims_bytes)
+
+    # Intégration d'un bloc brut : encodage, agrégats partiels, puis le bloc est libéré
+    def add_chunk(self, chunk):
+        # Bloc brut, plus sa copie pendant la lecture et le compactage
+        raw_bytes = 2 * int(chunk.memory_usage(deep=True).sum())
+        compact_frame(chunk)
+        self.chunk_bytes = int(chunk.memory_usage(deep=True).sum())
+        self.profile.update(chunk)
+        batch = pd.DataFrame({key: self.dimensions[dim].encode(chunk[dim]) for dim, key in KEY_COLUMNS.items()})
+        for col in MEASURE_COLUMNS:
+            batch[col] = chunk[col].to_numpy()
+        self.dims_bytes = sum(dimension.memory_usage() for dimension in self.dimensions.values())
+
+        deltas = {}
+        for dims, parent in STREAM_CUBOIDS:
+            source = batch.assign(Transactions=1) if parent is None else deltas[parent]
+            deltas[dims] = rollup(source, [KEY_COLUMNS[dim] for dim in dims])
+            if dims in self.pending:
+                self.pending[dims].append(deltas[dims])
+                self.pending_bytes += frame_bytes(deltas[dims])
+        # Les esquisses suivent les deltas du bloc : elles restent complètes même si les cuboïdes détaillés sont abandonnés
+        self.approx = self.approx.update(deltas[('Country', 'Month', 'CustomerID')],
+                                         deltas[('Country', 'Month', 'ProductName')])
+        self.rows += len(chunk)
+        self.chunks += 1
+
+        # Bloc encodé, agrégation de ses lignes, et agrégats des cuboïdes abandonnés (les autres sont en attente)
+        dropped_deltas = sum(frame_bytes(deltas[dims]) for dims in deltas if dims not in self.pending)
+        self.track(raw_bytes + (ROLLUP_COPIES + 2) * frame_bytes(batch) + dropped_deltas)
+        self.enforce_limit()
+        if self.pending_bytes > self.memory_limit // 8:
+            self.compact()
+            self.enforce_limit()
+
+    # Fusion des agrégats partiels dans les cuboïdes
+    def compact(self):
+        for dims, parts in self.pending.items():
+            if parts:
+                # Les cuboïdes initiaux (vides) sont écartés pour garder les types des mesures
+                tables = ([self.cuboids[dims]] if self.merged else []) + parts
+                # Pendant la fusion : la concaténation et la mémoire de son agrégation s'ajoutent à l'état
+                self.track((ROLLUP_COPIES + 1) * sum(frame_bytes(table) for table in tables))
+                merged = rollup(pd.concat(tables, ignore_index=True), [KEY_COLUMNS[dim] for dim in dims])
+                self.state_bytes += frame_bytes(merged) - frame_bytes(self.cuboids[dims])
+                self.cuboids[dims] = merged
+        self.pending = {dims: [] for dims in self.cuboids}
+        self.pending_bytes = 0
+        self.merged = self.merged or self.chunks > 0
+        self.state_bytes = sum(frame_bytes(table) for table in self.cuboids.values()) + self.approx.memory_usage()
+        self.dims_bytes = sum(dimension.memory_usage() for dimension in self.dimensions.values())
+        self.track()
+
+    # Mémoire de la prochaine fusion : concaténation et agrégation du plus gros cuboïde avec ses agrégats en attente
+    def merge_bytes(self):
+        sizes = [frame_bytes(self.cuboids[dims]) + sum(frame_bytes(part) for part in parts)
+                 for dims, parts in self.pending.items() if parts]
+        return (ROLLUP_COPIES + 1) * max(sizes, default=0)
+
+    # Abandon des cuboïdes détaillés tant que l'état et sa prochaine fusion dépassent leur part du plafond
+    def enforce_limit(self):
+        budget = self.memory_limit - self.memory_limit // 4
+        while self.resident_bytes + self.merge_bytes() > budget:
+            droppable = [dims for dims in self.cuboids if dims not in ESSENTIAL_CUBOIDS]
+            if not droppable:
+                break
+            largest = max(droppable, key=lambda dims: frame_bytes(self.cuboids[dims])
+                          + sum(frame_bytes(part) for part in self.pending[dims]))
+            self.state_bytes -= frame_bytes(self.cuboids.pop(largest))
+            self.pending_bytes -= sum(frame_bytes(part) for part in self.pending.pop(largest))
+            self.dropped.append(largest)
+
+    # Jeu de données final : dimensions, cube (éventuellement partiel) et catalogue, sans table de faits
+    def finish(self, key, name=None):
+        self.compact()
+        for dimension in self.dimensions.values():
+            dimension.release()
+        self.dims_bytes = sum(dimension.memory_usage() for dimension in self.dimensions.values())
+        star = StarSchema(empty_star().fact, {dim: dimension.table() for dim, dimension in self.dimensions.items()})
+        counts = {dim: pd.Series(dimension.counts, index=star.dims[dim].index)
+                  for dim, dimension in self.dimensions.items()}
+        catalog = build_catalog(star, previous_counts=counts)
+        # Tables des dimensions, comptes et catalogue (trié par copie), libellés du catalogue en listes
+        tables = sum(frame_bytes(table) + 2 * frame_bytes(catalog.entries[dim]) + 8 * catalog.cardinality(dim)
+                     for dim, table in star.dims.items())
+        self.track(tables + sum(series.nbytes for series in counts.values()))
+        dataset = Dataset(key, star, Cube(star, self.cuboids), name, catalog, self.profile, self.approx)
+        dataset.streamed = True
+        return dataset
+
+
+# Fonction pour agréger un fichier CSV, Parquet ou XLSX en flux, sans le charger entièrement
+def stream_dataset(path, memory_limit=None):
+    path = Path(path)
+    memory_limit = memory_limit or STREAM_MEMORY_MB * 1024 * 1024
+    start = time.perf_counter()
+    chunk_rows = chunk_rows_for(path, memory_limit // 16)
+    aggregator = StreamingAggregator(memory_limit)
+    for chunk in iter_sales_chunks(path, path.name, chunk_rows, columns=REQUIRED_COLUMNS):
+        if aggregator.chunks == 0:
+            check_required_columns(chunk)
+        aggregator.add_chunk(chunk)
+    dataset = aggregator.finish(stream_key(path))
+    report = {
+        'rows': aggregator.rows,
+        'chunks': aggregator.chunks,
+        'chunk_rows': chunk_rows,
+        'seconds': time.perf_counter() - start,
+        'peak_bytes': aggregator.peak_bytes,
+        'dims_bytes': aggregator.peak_dims_bytes,
+        'memory_limit': memory_limit,
+        'dropped': [' × '.join(dims) for dims in aggregator.dropped],
+    }
+    return dataset, report